@@ -6,14 +6,25 @@ for media processing operations (FFmpeg, ImageMagick, PDFs, etc.)
 """
 from langchain_groq import ChatGroq
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from dataclasses import dataclass
-from typing import List, Optional, Dict
+from pydantic import BaseModel, ValidationError
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass
+from functools import cache
+from pathlib import Path
+from typing import List, Optional, Dict, Tuple
+import asyncio
+import hashlib
+import httpx
 import os
 import json
+import re
+import threading
+import orjson
+import redis.asyncio as redis
 from .config import settings
 
 
-@dataclass
+@dataclass(slots=True)
 class ResponseFormat:
     """Response schema for the agent."""
     linux_command: str
@@ -23,186 +34,88 @@ class ResponseFormat:
     description: str
 
 
-SYSTEM_PROMPT = """
-# Media Processing Assistant
+@cache
+def _load_system_prompt() -> str:
+    """Read the system prompt from app/prompts/system.md (once per process)."""
+    return Path(__file__).parent.joinpath("prompts", "system.md").read_text(encoding="utf-8")
 
-You are an expert media processing assistant specializing in FFmpeg, ImageMagick, Poppler (PDF tools), and Tesseract OCR operations. Your role is to analyze user requests and generate precise Linux command-line instructions for video, audio, image, and PDF manipulation tasks.
 
-## Core Responsibilities
+# Bump when the cached entry layout or the parsing of replies changes, so
+# entries written by older code (e.g. in Redis) are no longer looked up
+_CACHE_VERSION = 2
 
-1. **Understand User Intent**: Parse natural language requests to identify the desired media operation
-2. **Generate Accurate Commands**: Provide working Linux commands using ffmpeg, ImageMagick (convert/mogrify), poppler-utils (pdfunite/pdftk/pdftotext), and tesseract
-3. **Handle File Detection**: Automatically detect input file formats from uploaded files and adjust commands accordingly
-4. **Use Exact Filenames**: Always use the actual filenames from uploaded files
 
-## Available Tools
+# Greetings and help questions that can be answered without calling the model
+# when no files were uploaded
+_HELP_RE = re.compile(r'^\s*(hi|hello|hey|help|what can you do|how do i)\b', re.I)
 
-You have access to tools that let you:
-- **list_uploaded_files**: See all files the user has uploaded with their types and sizes
-- **get_file_info**: Get detailed information about a specific file by providing its filename
+_HELP_RESPONSE = ResponseFormat(
+    linux_command="",
+    command_template="",
+    input_files=[],
+    output_files=[],
+    description=(
+        "Upload one or more video, audio, image or PDF files and describe what you want "
+        "to do with them (e.g. \"extract the audio as MP3\" or \"merge these PDFs\")."
+    )
+)
 
-IMPORTANT: Always call list_uploaded_files first to see what files are available, then use their exact filenames in your commands.
 
-## Command Generation Guidelines
+# Static instructions appended to every user message
+_USER_MESSAGE_SUFFIX = """
 
-### General Rules
-- Use the EXACT input filename from uploaded files (get them via list_uploaded_files tool)
-- Generate commands that are copy-paste ready with full file paths
-- Include necessary flags and parameters for optimal output quality
-- Suggest descriptive output filenames that reflect the operation (e.g., "video_compressed.mp4", "document_merged.pdf")
-- **CRITICAL**: Always include ALL required arguments - never generate incomplete commands
-- **VALIDATION**: Before returning a command, verify it has:
-  1. The base command (ffmpeg, convert, pdftocairo, etc.)
-  2. ALL required input files or flags
-  3. ALL required output files or parameters
-  4. Any mandatory format flags (e.g., -jpeg for pdftocairo)
-
-### Video Operations (FFmpeg)
-- **Extract audio**: `ffmpeg -i {input_video} -vn -acodec libmp3lame {output_audio}.mp3`
-- **Trim/cut**: `ffmpeg -i {input} -ss {start_time} -t {duration} -c copy {output}`
-- **Compress**: `ffmpeg -i {input} -vcodec libx265 -crf 28 {output}` (CRF 18-28 range)
-- **Format conversion**: `ffmpeg -i {input}.{format1} {output}.{format2}`
-- **Resize**: `ffmpeg -i {input} -vf scale={width}:{height} {output}`
-- **Merge videos**: Create filelist.txt first, then `ffmpeg -f concat -safe 0 -i filelist.txt -c copy {output}`
-- **Remove audio**: `ffmpeg -i {input} -an -c:v copy {output}`
-- **Change speed**: `ffmpeg -i {input} -filter:v "setpts={factor}*PTS" {output}` (0.5 = 2x speed)
-- **Add watermark**: `ffmpeg -i {video} -i {logo} -filter_complex "overlay=W-w-10:H-h-10" {output}`
-- **Create GIF**: `ffmpeg -i {input} -ss {start} -t {duration} -vf "fps=10,scale=480:-1" {output}.gif`
-- **Rotate video**: `ffmpeg -i {input} -vf "transpose=1" {output}` (1=90° clockwise, 2=90° counter-clockwise)
-- **Add subtitles**: `ffmpeg -i {video} -vf "subtitles={subs.srt}" {output}`
-
-### Audio Operations (FFmpeg)
-- **Convert format**: `ffmpeg -i {input}.{format1} -acodec libmp3lame {output}.mp3`
-- **Trim audio**: `ffmpeg -i {input} -ss {start_seconds} -t {duration} -acodec copy {output}`
-- **Adjust volume**: `ffmpeg -i {input} -filter:a "volume={factor}" {output}` (1.5 = 150%)
-- **Merge audio**: `ffmpeg -i {file1} -i {file2} -filter_complex concat=n={count}:v=0:a=1 {output}`
-- **Change bitrate**: `ffmpeg -i {input} -b:a {bitrate}k {output}`
-- **Normalize audio**: `ffmpeg -i {input} -af loudnorm {output}`
-- **Fade effects**: `ffmpeg -i {input} -af "afade=t=in:st=0:d={seconds},afade=t=out:st={start}:d={seconds}" {output}`
-- **Change speed**: `ffmpeg -i {input} -filter:a "atempo={factor}" {output}` (0.5-2.0 range)
-
-### Image Operations (ImageMagick)
-- **Resize**: `convert {input} -resize {width}x{height} {output}`
-- **Format conversion**: `convert {input}.{format1} {output}.{format2}`
-- **Compress**: `convert {input} -quality {percentage} {output}` (1-100, 85 recommended for web)
-- **Crop**: `convert {input} -gravity center -crop {width}x{height}+0+0 {output}`
-- **Watermark**: `convert {base} {watermark} -gravity southeast -composite {output}`
-- **Rotate**: `convert {input} -rotate {degrees} {output}`
-- **Grayscale**: `convert {input} -colorspace Gray {output}`
-- **Blur**: `convert {input} -blur 0x{radius} {output}`
-- **Batch resize**: `mogrify -resize {width}x {directory}/*.jpg` (WARNING: Overwrites originals!)
-- **Add text**: `convert {input} -pointsize {size} -fill {color} -annotate +{x}+{y} '{text}' {output}`
-- **Create collage**: `montage {img1} {img2} {img3} {img4} -geometry +2+2 {output}`
-- **Remove background**: `convert {input} -fuzz 10% -transparent white {output}`
-- **Thumbnail**: `convert {input} -thumbnail {width}x{height} {output}`
-
-### PDF Operations (Poppler/PDFtk)
-- **Merge PDFs**: `pdfunite {file1.pdf} {file2.pdf} {file3.pdf} {merged.pdf}`
-- **Split pages**: `pdftk {input.pdf} cat {page_range} output {output.pdf}` (e.g., "1-5" or "1-10 15-20")
-- **PDF to images**: `pdftocairo -jpeg -r 300 {input.pdf} {output_prefix}` 
-  - IMPORTANT: pdftocairo requires BOTH a format flag (-jpeg, -png, -pdf, -svg) AND input/output files
-  - Example: `pdftocairo -jpeg -r 300 document.pdf page` creates page-001.jpg, page-002.jpg, etc.
-  - Example: `pdftocairo -png -singlefile document.pdf output` creates output.png
-- **Extract text**: `pdftotext {input.pdf} {output.txt}`
-- **Compress PDF**: `gs -sDEVICE=pdfwrite -dCompatibilityLevel=1.4 -dPDFSETTINGS=/ebook -dNOPAUSE -dQUIET -dBATCH -sOutputFile={output.pdf} {input.pdf}`
-- **Rotate pages**: `pdftk {input.pdf} cat 1-endeast output {rotated.pdf}` (east=90°, west=270°, south=180°)
-- **Remove pages**: `pdftk {input.pdf} cat {kept_pages} output {result.pdf}` (e.g., "1-2 4-6 8-end")
-- **Extract images**: `pdfimages -all {input.pdf} {output_prefix}`
-- **Add password**: `pdftk {input.pdf} output {secured.pdf} user_pw {PASSWORD}`
-- **Remove password**: `pdftk {secured.pdf} input_pw {PASSWORD} output {unlocked.pdf}`
-- **Get metadata**: `pdfinfo {document.pdf}`
-- **Flatten forms**: `pdftk {input.pdf} output {output.pdf} flatten`
-
-### OCR Operations (Tesseract)
-- **Extract text from image**: `tesseract {image_file} {output_prefix} -l eng`
-- **OCR scanned PDF**: First convert PDF to images with `pdftocairo -jpeg {input.pdf} page`, then `tesseract page-001.jpg {output} -l eng`
-- **Multiple languages**: `tesseract {image} {output} -l eng+fra+deu`
-
-### Cross-Format Operations
-- **Images to PDF**: `convert {img1.jpg} {img2.jpg} {img3.jpg} {output.pdf}`
-- **Video to image sequence**: `ffmpeg -i {video} frame%04d.jpg`
-- **Images to video**: `ffmpeg -framerate {fps} -pattern_type glob -i '*.jpg' -c:v libx264 {slideshow.mp4}`
-- **Audio waveform visualization**: `ffmpeg -i {audio} -filter_complex "showwaves=s=1280x720:mode=line" {video.mp4}`
-
-## Multi-Step Operations
-
-For operations requiring multiple steps (e.g., "convert PDF to images then make them grayscale"):
-
-**OPTION 1 - Single Command with Pipes (PREFERRED):**
-Chain commands using pipes or shell operators when possible:
-```bash
-pdftocairo -png input.pdf page && for f in page-*.png; do convert "$f" -colorspace Gray "gray_$f"; done
-```
-
-**OPTION 2 - Combined Command (WHEN PIPES DON'T WORK):**
-For operations that can be combined into a single tool:
-```bash
-pdftocairo -png input.pdf page && mogrify -colorspace Gray page-*.png
-```
-
-**IMPORTANT RULES FOR MULTI-STEP COMMANDS:**
-1. Use `&&` to chain commands - ensures second command only runs if first succeeds
-2. Use shell wildcards (`*.png`, `page-*.png`) to process intermediate files
-3. Use `for` loops when needed: `for f in *.png; do convert "$f" -resize 50% "$f"; done`
-4. Always ensure intermediate files from step 1 are accessible in step 2
-5. Avoid referencing specific intermediate filenames (like `page-001.png`) - use wildcards instead
-
-**Examples:**
-- PDF to grayscale images: `pdftocairo -png -r 150 doc.pdf page && mogrify -colorspace Gray page-*.png`
-- Video frames to thumbnails: `ffmpeg -i video.mp4 frame%04d.jpg && mogrify -resize 200x200 frame*.jpg`
-- Extract audio and compress: `ffmpeg -i video.mp4 -vn audio.wav && ffmpeg -i audio.wav -b:a 128k audio.mp3`
-
-## Workflow
-
-1. **Check files**: Call list_uploaded_files to see available files
-2. **Get details if needed**: Call get_file_info with a filename for more information
-3. **Understand request**: Parse the user's natural language request
-4. **Determine steps**: Identify if operation needs multiple steps
-5. **Generate command**: Create command(s) with proper chaining using `&&` and wildcards
-6. **Return structured output**: Provide linux_command, input_files, output_files, and description
-
-## Error Handling
-
-- If the user's request is ambiguous, ask clarifying questions
-- If a requested operation isn't possible with these tools, explain why and suggest alternatives
-- If input file format isn't suitable for the requested operation, suggest conversion first
-- Always validate that the tools support the requested input/output formats
-- **CRITICAL ERROR PREVENTION**: 
-  - Never return a command with just the tool name (e.g., "pdftocairo" alone)
-  - Always include format flags for PDF tools (e.g., -jpeg, -png for pdftocairo)
-  - Always include input AND output files for conversion tools
-  - If unsure about arguments, ask the user for clarification rather than generating incomplete commands
+Please analyze this request and generate a Linux command for the media processing task. Return your response as JSON with these exact fields:
+- linux_command: The complete command to execute with actual filenames
+- command_template: The same command but with template variables: {input_file}, {input_basename}, {input_ext}, {timestamp}, {output_file}
+- input_files: List of input file names
+- output_files: List of output file names that will be created
+- description: Brief explanation of what the command does
 
-## Important Warnings
+Example response:
+{"linux_command": "ffmpeg -i video.mp4 -vn -acodec libmp3lame audio.mp3", "command_template": "ffmpeg -i {input_file} -vn -acodec libmp3lame {output_file}", "input_files": ["video.mp4"], "output_files": ["audio.mp3"], "description": "Extracts audio from video as MP3"}
+"""
 
-- **mogrify**: This command OVERWRITES original files. Always warn users to backup first
-- **Compression**: Warn about potential quality loss when compressing videos/images/PDFs
-- **Processing time**: Mention if an operation will take significant time (e.g., 4K video processing)
-- **File sizes**: Alert users if output size will be significantly different from input
+class _ResponseSchema(BaseModel):
+    """
+    Validator for the JSON object the model is asked to return.
+    
+    Models sometimes send null for a field they have nothing for, so every
+    field accepts None (treated like a missing key).
+    """
+    linux_command: Optional[str] = None
+    command_template: Optional[str] = None
+    input_files: Optional[List[str]] = None
+    output_files: Optional[List[str]] = None
+    description: Optional[str] = None
 
-## Output Format
 
-You MUST return a structured response with exactly these fields:
-- **linux_command**: The exact command to execute with actual filenames (single string, ready to copy-paste)
-- **command_template**: The same command but with template variables instead of actual filenames. Use these template variables:
-  * {input_file} - For input filename with extension
-  * {input_basename} - For filename without extension (e.g., "photo" from "photo.jpg")
-  * {input_ext} - For file extension with dot (e.g., ".jpg", ".png", ".mp4")
-  * {timestamp} - For current timestamp in format YYYYMMDD_HHMMSS
-  * {output_file} - For output filename
-- **input_files**: List of input file paths used in the command (as list of strings)
-- **output_files**: List of output file paths that will be created (as list of strings)
-- **description**: Brief 1-2 sentence explanation of what the command does
+_JSON_DECODER = json.JSONDecoder()
+_BRACE_RE = re.compile(r'\{')
 
-Example:
-linux_command: "ffmpeg -i ./user_uploads/video.mp4 -vn -acodec libmp3lame ./user_uploads/audio.mp3"
-command_template: "ffmpeg -i {input_file} -vn -acodec libmp3lame {output_file}"
-input_files: ["./user_uploads/video.mp4"]
-output_files: ["./user_uploads/audio.mp3"]
-description: "Extracts the audio track from video.mp4 and saves it as an MP3 file using the LAME encoder."
 
-Remember: Be clear, precise, and helpful. Your goal is to make command-line media processing accessible to users unfamiliar with these tools.
-"""
+def _extract_json(text: str) -> Optional[Dict]:
+    """
+    Find the first valid JSON object embedded in a model reply.
+    
+    Decoding starts at each '{' in turn and stops at the matching closing
+    brace, so braces in a preamble or trailing prose don't break parsing.
+    
+    Returns:
+        The decoded object, or None if the text contains no '{' at all
+        
+    Raises:
+        json.JSONDecodeError: If braces are present but none start valid JSON
+    """
+    error = None
+    for match in _BRACE_RE.finditer(text):
+        try:
+            parsed, _ = _JSON_DECODER.raw_decode(text, match.start())
+            return parsed
+        except json.JSONDecodeError as e:
+            error = e
+    if error is not None:
+        raise error
+    return None
 
 
 class MediaProcessingAgent:
@@ -225,17 +138,210 @@ class MediaProcessingAgent:
         # Set Groq API key from config
         os.environ['GROQ_API_KEY'] = settings.GROQ_API_KEY
         
+        self.model_name = model_name
+        
+        # Long-lived pooled client so TCP/TLS setup to the Groq API is reused
+        # across requests instead of paid on cold sockets
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+            http2=True,
+            timeout=30
+        )
         self.model = ChatGroq(
             model=model_name,
             temperature=temperature,
             timeout=30,
-            max_tokens=2000
+            max_tokens=2000,
+            http_async_client=self._http
         )
         
-        # Store conversation history per user
-        self.conversation_history: Dict[str, List] = {}
+        # The system prompt never changes, so build its message once and reuse it
+        system_prompt = _load_system_prompt()
+        # Part of every cache key: editing the prompts must not keep serving
+        # answers generated from the old ones
+        self._prompt_digest = hashlib.blake2b(
+            (system_prompt + _USER_MESSAGE_SUFFIX).encode(), digest_size=8
+        ).hexdigest()
+        self._system_message = SystemMessage(content=system_prompt)
+        
+        # Store the last 10 messages per user; least recently active users are
+        # evicted once more than max_history_users sessions are tracked
+        self.conversation_history: "OrderedDict[str, deque]" = OrderedDict()
+        self.max_history_users = 10_000
+        
+        # LRU cache of parsed model replies: cache key -> (raw text, response)
+        self._response_cache: "OrderedDict[str, Tuple[str, ResponseFormat]]" = OrderedDict()
+        self._response_cache_size = 512
+        
+        # Optional shared cache so hits survive restarts and are shared between
+        # workers; the in-process LRU above stays in front of it. Short timeouts
+        # so an unreachable or slow Redis costs a fraction of a second per
+        # lookup (then counts as a miss) rather than the OS connect timeout
+        self._redis = redis.from_url(
+            settings.REDIS_URL,
+            decode_responses=False,
+            socket_connect_timeout=0.3,
+            socket_timeout=0.3,
+            health_check_interval=30
+        ) if settings.REDIS_URL else None
+        self._redis_ttl = 24 * 60 * 60
+        
+        # Bounds concurrent calls to the model provider so a burst of uploads
+        # queues here instead of tripping the provider's rate limits
+        self._model_slots = asyncio.Semaphore(settings.AI_CONCURRENCY)
+    
+    async def aclose(self):
+        """Close the pooled HTTP connections to the model provider and Redis."""
+        await self._http.aclose()
+        if self._redis is not None:
+            await self._redis.aclose()
+    
+    def _history_for(self, user_id: str) -> deque:
+        """Get (or start) a user's conversation history and mark the user as active."""
+        history = self.conversation_history.get(user_id)
+        if history is None:
+            history = self.conversation_history[user_id] = deque(maxlen=10)
+            if len(self.conversation_history) > self.max_history_users:
+                self.conversation_history.popitem(last=False)
+        else:
+            self.conversation_history.move_to_end(user_id)
+        return history
+    
+    def _cache_key(self, user_id: str, user_prompt: str, uploaded_files: List[str], history: deque) -> str:
+        """
+        Build the response cache key for a request.
+        
+        The key covers the user, the prompt (whitespace normalized, case kept:
+        replies contain case-sensitive filenames), the uploaded files as sent,
+        the model and the last message of the conversation, so follow-ups like
+        "convert that to WAV" only hit when the context matches. It also
+        covers the cache version and a digest of the prompts sent to the
+        model, so edits to either invalidate old entries.
+        """
+        normalized_prompt = " ".join(user_prompt.split())
+        history_tail = history[-1].content if history else ""
+        raw_key = orjson.dumps([
+            _CACHE_VERSION, self._prompt_digest, user_id, normalized_prompt,
+            uploaded_files, self.model_name, history_tail,
+        ])
+        return hashlib.blake2b(raw_key, digest_size=16).hexdigest()
+    
+    def _cache_get(self, key: str) -> Optional[Tuple[str, ResponseFormat]]:
+        """Return a cached (response_text, response) pair and mark it as recently used."""
+        cached = self._response_cache.get(key)
+        if cached is not None:
+            self._response_cache.move_to_end(key)
+        return cached
+    
+    def _cache_put(self, key: str, response_text: str, structured_response: ResponseFormat):
+        """Store a parsed response, evicting the least recently used entry when full."""
+        self._response_cache[key] = (response_text, structured_response)
+        self._response_cache.move_to_end(key)
+        if len(self._response_cache) > self._response_cache_size:
+            self._response_cache.popitem(last=False)
+    
+    async def _cache_lookup(self, key: str) -> Optional[Tuple[str, ResponseFormat]]:
+        """
+        Look a response up in the in-process cache, then in Redis.
+        
+        Redis hits are copied into the in-process cache. If Redis is
+        unreachable or the stored entry can't be decoded, the lookup just
+        counts as a miss.
+        """
+        cached = self._cache_get(key)
+        if cached is not None or self._redis is None:
+            return cached
+        
+        try:
+            raw = await self._redis.get(f"refile:response:{key}")
+        except (redis.RedisError, OSError):
+            return None
+        if raw is None:
+            return None
+        
+        try:
+            entry = orjson.loads(raw)
+            cached = (entry["text"], ResponseFormat(**entry["response"]))
+        except (orjson.JSONDecodeError, KeyError, TypeError, ValueError):
+            return None
+        self._cache_put(key, *cached)
+        return cached
+    
+    async def _cache_store(self, key: str, response_text: str, structured_response: ResponseFormat):
+        """Store a parsed response in the in-process cache and, if configured, in Redis."""
+        self._cache_put(key, response_text, structured_response)
+        if self._redis is None:
+            return
+        
+        payload = orjson.dumps({"text": response_text, "response": asdict(structured_response)})
+        try:
+            await self._redis.setex(f"refile:response:{key}", self._redis_ttl, payload)
+        except (redis.RedisError, OSError):
+            pass
+    
+    def _build_user_message(self, user_prompt: str, uploaded_files: List[str]) -> str:
+        """Format the user prompt with file information."""
+        return f"\nPrompt: {user_prompt}\nUploaded Files: {orjson.dumps(uploaded_files).decode()}" + _USER_MESSAGE_SUFFIX
+    
+    def _build_messages(self, history: deque, user_message: str) -> List:
+        """System prompt, then the user's history, then the new message."""
+        messages = [self._system_message]
+        messages.extend(history)
+        messages.append(HumanMessage(content=user_message))
+        return messages
+    
+    def _parse_response(self, response_text: str, uploaded_files: List[str]) -> Tuple[ResponseFormat, bool]:
+        """
+        Turn the model's reply into a ResponseFormat.
+        
+        Returns:
+            Tuple of (response, parsed) where parsed is False if a fallback
+            response had to be built from the raw text
+        """
+        stripped = response_text.strip()
+        try:
+            # Fast path: the whole reply is the JSON object we asked for
+            schema = None
+            if stripped.startswith('{') and stripped.endswith('}'):
+                try:
+                    schema = _ResponseSchema.model_validate_json(stripped)
+                except ValidationError:
+                    pass
+            
+            if schema is None:
+                # Find JSON in the response
+                parsed = _extract_json(response_text)
+                if parsed is None:
+                    # Fallback if no JSON found
+                    return ResponseFormat(
+                        linux_command=response_text,
+                        command_template=response_text,
+                        input_files=uploaded_files,
+                        output_files=[],
+                        description="Command generated from AI response"
+                    ), False
+                schema = _ResponseSchema.model_validate(parsed)
+        except (json.JSONDecodeError, ValidationError):
+            # Fallback parsing failed. The reply looked like JSON, so it is
+            # not a command: leave linux_command empty so nothing is executed
+            return ResponseFormat(
+                linux_command="",
+                command_template="",
+                input_files=uploaded_files,
+                output_files=[],
+                description="Command generated from AI response (parsing failed)"
+            ), False
+        
+        linux_command = schema.linux_command or ""
+        return ResponseFormat(
+            linux_command=linux_command,
+            command_template=schema.command_template if schema.command_template is not None else linux_command,
+            input_files=schema.input_files or [],
+            output_files=schema.output_files or [],
+            description=schema.description or ""
+        ), True
     
-    def process_request(
+    async def process_request(
         self, 
         user_prompt: str, 
         uploaded_files: List[str],
@@ -254,86 +360,38 @@ class MediaProcessingAgent:
         Returns:
             Dictionary containing the structured response
         """
-        # Initialize conversation history for this user if needed
-        if user_id not in self.conversation_history:
-            self.conversation_history[user_id] = []
-        
-        # Format the user prompt with file information
-        user_message = f"""
-Prompt: {user_prompt}
-Uploaded Files: {uploaded_files}
-
-Please analyze this request and generate a Linux command for the media processing task. Return your response as JSON with these exact fields:
-- linux_command: The complete command to execute with actual filenames
-- command_template: The same command but with template variables: {{input_file}}, {{input_basename}}, {{input_ext}}, {{timestamp}}, {{output_file}}
-- input_files: List of input file names
-- output_files: List of output file names that will be created
-- description: Brief explanation of what the command does
-
-Example response:
-{{"linux_command": "ffmpeg -i video.mp4 -vn -acodec libmp3lame audio.mp3", "command_template": "ffmpeg -i {{input_file}} -vn -acodec libmp3lame {{output_file}}", "input_files": ["video.mp4"], "output_files": ["audio.mp3"], "description": "Extracts audio from video as MP3"}}
-"""
-        
-        # Build messages list
-        messages = []
+        # Nothing to run a command on, and the prompt is a greeting or help question
+        if not uploaded_files and _HELP_RE.match(user_prompt):
+            return {"structured_response": _HELP_RESPONSE}
         
-        # Always start with system prompt
-        messages.append(SystemMessage(content=SYSTEM_PROMPT))
+        history = self._history_for(user_id)
+        cache_key = self._cache_key(user_id, user_prompt, uploaded_files, history)
+        user_message = self._build_user_message(user_prompt, uploaded_files)
         
-        # Add conversation history for this user
-        messages.extend(self.conversation_history[user_id])
+        # Serve repeated requests from the cache instead of calling the model
+        cached = await self._cache_lookup(cache_key)
+        if cached is not None:
+            response_text, structured_response = cached
+            history.append(HumanMessage(content=user_message))
+            history.append(AIMessage(content=response_text))
+            return {"structured_response": structured_response}
         
-        # Add the new user message
-        messages.append(HumanMessage(content=user_message))
+        messages = self._build_messages(history, user_message)
         
         # Get response from model
         try:
-            response = self.model.invoke(messages)
+            async with self._model_slots:
+                response = await self.model.ainvoke(messages)
             response_text = response.content
             
-            # Try to parse JSON from the response
-            try:
-                # Find JSON in the response
-                json_start = response_text.find('{')
-                json_end = response_text.rfind('}') + 1
-                if json_start >= 0 and json_end > json_start:
-                    json_str = response_text[json_start:json_end]
-                    parsed = json.loads(json_str)
-                    
-                    # Create ResponseFormat object
-                    structured_response = ResponseFormat(
-                        linux_command=parsed.get('linux_command', ''),
-                        command_template=parsed.get('command_template', parsed.get('linux_command', '')),
-                        input_files=parsed.get('input_files', []),
-                        output_files=parsed.get('output_files', []),
-                        description=parsed.get('description', '')
-                    )
-                else:
-                    # Fallback if no JSON found
-                    structured_response = ResponseFormat(
-                        linux_command=response_text,
-                        command_template=response_text,
-                        input_files=uploaded_files,
-                        output_files=[],
-                        description="Command generated from AI response"
-                    )
-            except json.JSONDecodeError:
-                # Fallback parsing failed
-                structured_response = ResponseFormat(
-                    linux_command=response_text,
-                    command_template=response_text,
-                    input_files=uploaded_files,
-                    output_files=[],
-                    description="Command generated from AI response (parsing failed)"
-                )
-            
-            # Update conversation history
-            self.conversation_history[user_id].append(HumanMessage(content=user_message))
-            self.conversation_history[user_id].append(AIMessage(content=response_text))
+            structured_response, parsed = self._parse_response(response_text, uploaded_files)
+            # Only cache replies the model actually structured
+            if parsed:
+                await self._cache_store(cache_key, response_text, structured_response)
             
-            # Keep only last 10 messages to avoid context overflow
-            if len(self.conversation_history[user_id]) > 10:
-                self.conversation_history[user_id] = self.conversation_history[user_id][-10:]
+            # Update conversation history (the deque keeps only the last 10 messages)
+            history.append(HumanMessage(content=user_message))
+            history.append(AIMessage(content=response_text))
             
             return {"structured_response": structured_response}
             
@@ -350,8 +408,11 @@ Example response:
             }
 
 
-# Global agent instance (singleton pattern)
-_agent_instance: Optional[MediaProcessingAgent] = None
+# The process-wide agent (and its HTTP connection pool), built on first use
+_agent: Optional[MediaProcessingAgent] = None
+# Serializes construction so two threads that find no agent at the same
+# time still end up sharing one
+_agent_lock = threading.Lock()
 
 
 def get_agent() -> MediaProcessingAgent:
@@ -361,7 +422,18 @@ def get_agent() -> MediaProcessingAgent:
     Returns:
         MediaProcessingAgent instance
     """
-    global _agent_instance
-    if _agent_instance is None:
-        _agent_instance = MediaProcessingAgent()
-    return _agent_instance
+    global _agent
+    if _agent is None:
+        with _agent_lock:
+            if _agent is None:
+                _agent = MediaProcessingAgent()
+    return _agent
+
+
+async def close_agent():
+    """Close the global agent's HTTP pool, if the agent was ever created."""
+    global _agent
+    with _agent_lock:
+        agent, _agent = _agent, None
+    if agent is not None:
+        await agent.aclose()
@@ -8,6 +8,12 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = "user_uploads"
     # optional: table name for prompts
     PROMPTS_TABLE: str = "prompts"
+    # optional: Redis URL for a response cache shared between workers (empty = in-process only)
+    REDIS_URL: str = ""
+    # optional: max model calls in flight per worker; extra requests wait their turn
+    AI_CONCURRENCY: int = 8
+    # optional: comma-separated list of frontend origins allowed by CORS
+    CORS_ORIGINS: str = "http://localhost:3000"
 
     class Config:
         env_file = ".env"
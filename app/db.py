@@ -1,13 +1,64 @@
-from supabase import create_client
+from __future__ import annotations
+
+import httpx
+from cachetools import TTLCache
+from supabase import ClientOptions, create_client
 from .config import settings
-from datetime import datetime
+from datetime import datetime, timezone
+from functools import lru_cache
+from uuid import UUID
+import threading
+import time
+
+
+@lru_cache(maxsize=1)
+def _iso_now(bucket: int) -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def iso_now() -> str:
+    """Current UTC time as ISO 8601, formatted at most once per second"""
+    return _iso_now(int(time.time()))
+
 
 class SupabaseClient:
     def __init__(self):
         if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
             raise RuntimeError("Supabase credentials not set in environment")
-        self.client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+        # Keep-alive pool shared by every query, so requests reuse warm
+        # TCP/TLS connections to Supabase instead of reconnecting
+        self._http = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+            timeout=5.0
+        )
+        self.client = create_client(
+            settings.SUPABASE_URL,
+            settings.SUPABASE_KEY,
+            options=ClientOptions(httpx_client=self._http)
+        )
         self.table = settings.PROMPTS_TABLE
+        
+        # Short-lived read caches so clients polling /api/status or /api/list
+        # don't cost a round trip per poll; the prompt writes below invalidate them
+        self._prompt_cache = TTLCache(maxsize=4096, ttl=2.0)  # prompt_id -> row
+        self._prompt_pages_cache = TTLCache(maxsize=4096, ttl=2.0)  # (user_id, before, before_id, limit) -> rows
+        self._cache_lock = threading.Lock()
+
+    def _invalidate_prompts(self, prompt_id: str = None, user_id: str = None):
+        """Drop cached reads for a prompt and/or all cached pages of a user"""
+        with self._cache_lock:
+            if prompt_id is not None:
+                cached = self._prompt_cache.pop(prompt_id, None)
+                if user_id is None and cached:
+                    user_id = cached.get("user_id")
+            if user_id is not None:
+                for key in [key for key in self._prompt_pages_cache if key[0] == user_id]:
+                    self._prompt_pages_cache.pop(key, None)
+
+    def close(self):
+        """Close the pooled HTTP connections"""
+        self._http.close()
 
     def insert_prompt(self, record: dict):
         """Insert a new prompt record into the database"""
@@ -16,106 +67,147 @@ class SupabaseClient:
         # Note: Supabase client may not always have status_code attribute
         if hasattr(res, 'status_code') and res.status_code >= 400:
             raise RuntimeError(res.error or "insert failed")
+        self._invalidate_prompts(user_id=record.get("user_id"))
         return res.data[0] if res.data else None
 
-    def get_prompts_for_user(self, user_id: str):
-        """Get all prompts for a specific user"""
-        res = self.client.table(self.table).select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
+    def get_prompts_for_user(self, user_id: str, *, before: datetime = None, before_id: UUID = None, limit: int = 50):
+        """Get a page of prompts for a specific user, newest first.
+        
+        Pass the created_at and id of the last row of a page as `before` and
+        `before_id` to get the next one; id breaks ties between rows with the
+        same timestamp. Pages are cached for 2 seconds.
+        """
+        key = (user_id, before, before_id, limit)
+        with self._cache_lock:
+            cached = self._prompt_pages_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        query = (self.client.table(self.table).select("*").eq("user_id", user_id)
+                 .order("created_at", desc=True).order("id", desc=True).limit(limit))
+        if before and before_id:
+            # keyset cursor: rows strictly after (before, before_id) in the sort
+            # order; the UUID() round-trip guarantees the id can't carry filter syntax
+            ts = before.isoformat()
+            query = query.or_(f'created_at.lt."{ts}",and(created_at.eq."{ts}",id.lt.{UUID(str(before_id))})')
+        elif before:
+            query = query.lt("created_at", before.isoformat())
+        res = query.execute()
         # Note: Supabase client may not always have status_code attribute
         if hasattr(res, 'status_code') and res.status_code >= 400:
             raise RuntimeError(res.error or "select failed")
+        with self._cache_lock:
+            self._prompt_pages_cache[key] = res.data
         return res.data
     
     def get_prompt_by_id(self, prompt_id: str):
-        """Get a specific prompt by ID"""
+        """Get a specific prompt by ID (cached for 2 seconds)"""
+        with self._cache_lock:
+            cached = self._prompt_cache.get(prompt_id)
+        if cached is not None:
+            return cached
+        
         res = self.client.table(self.table).select("*").eq("id", prompt_id).execute()
         if hasattr(res, 'status_code') and res.status_code >= 400:
             raise RuntimeError(res.error or "select failed")
-        return res.data[0] if res.data else None
+        if not res.data:
+            return None
+        with self._cache_lock:
+            self._prompt_cache[prompt_id] = res.data[0]
+        return res.data[0]
     
     def update_prompt_status(self, prompt_id: str, status: str):
         """Update the processing status of a prompt"""
-        data = {
-            "ai_processing_status": status,
-            "processed_at": datetime.utcnow().isoformat() if status in ["completed", "failed"] else None
-        }
+        data = {"ai_processing_status": status}
+        if status in ("completed", "failed"):
+            data["processed_at"] = iso_now()
         res = self.client.table(self.table).update(data).eq("id", prompt_id).execute()
         if hasattr(res, 'status_code') and res.status_code >= 400:
             raise RuntimeError(res.error or "update failed")
+        self._invalidate_prompts(prompt_id, res.data[0].get("user_id") if res.data else None)
         return res.data[0] if res.data else None
     
     def update_prompt_ai_response(self, prompt_id: str, ai_response: str = None, 
                                   ai_command: str = None, status: str = "completed",
                                   error_message: str = None):
         """Update prompt with AI response and command"""
+        # Only send the columns being set so unset ones aren't overwritten with NULL
         data = {
-            "ai_response": ai_response,
-            "ai_command": ai_command,
             "ai_processing_status": status,
-            "processed_at": datetime.utcnow().isoformat(),
+            "processed_at": iso_now(),
         }
         
+        if ai_response is not None:
+            data["ai_response"] = ai_response
+        if ai_command is not None:
+            data["ai_command"] = ai_command
         if error_message:
             data["error_message"] = error_message
         
         res = self.client.table(self.table).update(data).eq("id", prompt_id).execute()
         if hasattr(res, 'status_code') and res.status_code >= 400:
             raise RuntimeError(res.error or "update failed")
+        self._invalidate_prompts(prompt_id, res.data[0].get("user_id") if res.data else None)
         return res.data[0] if res.data else None
 
-def create_preset(self, preset_data: dict):
-    """Create a new preset"""
-    result = self.client.table('presets').insert(preset_data).execute()
-    return result.data[0] if result.data else None
+    def create_preset(self, preset_data: dict):
+        """Create a new preset"""
+        result = self.client.table('presets').insert(preset_data).execute()
+        return result.data[0] if result.data else None
 
-def list_presets(self, category=None, tag=None, search=None, user_id=None, limit=50, offset=0):
-    """List presets with filters"""
-    query = self.client.table('presets').select('*').eq('is_public', True)
-    
-    if category:
-        query = query.eq('category', category)
-    if tag:
-        query = query.contains('tags', [tag])
-    if search:
-        query = query.or_(f'name.ilike.%{search}%,description.ilike.%{search}%')
-    if user_id:
-        query = query.eq('user_id', user_id)
-    
-    query = query.order('likes_count', desc=True).range(offset, offset + limit - 1)
-    result = query.execute()
-    return result.data
-
-def get_preset_by_id(self, preset_id: str):
-    """Get a specific preset"""
-    result = self.client.table('presets').select('*').eq('id', preset_id).single().execute()
-    return result.data
-
-def has_user_liked_preset(self, preset_id: str, user_id: str):
-    """Check if user has liked a preset"""
-    result = self.client.table('preset_likes').select('id').eq('preset_id', preset_id).eq('user_id', user_id).execute()
-    return len(result.data) > 0
-
-def toggle_preset_like(self, preset_id: str, user_id: str):
-    """Toggle like on a preset"""
-    has_liked = self.has_user_liked_preset(preset_id, user_id)
-    
-    if has_liked:
-        # Unlike
-        self.client.table('preset_likes').delete().eq('preset_id', preset_id).eq('user_id', user_id).execute()
-        self.client.rpc('decrement_preset_likes', {'preset_id': preset_id}).execute()
-        new_count = self.get_preset_by_id(preset_id)['likes_count']
-        return {'liked': False, 'likes_count': new_count}
-    else:
-        # Like
-        self.client.table('preset_likes').insert({'preset_id': preset_id, 'user_id': user_id}).execute()
-        self.client.rpc('increment_preset_likes', {'preset_id': preset_id}).execute()
-        new_count = self.get_preset_by_id(preset_id)['likes_count']
-        return {'liked': True, 'likes_count': new_count}
-
-def increment_preset_usage(self, preset_id: str):
-    """Increment usage count"""
-    self.client.rpc('increment_preset_usage', {'preset_id': preset_id}).execute()
-
-def delete_preset(self, preset_id: str):
-    """Delete a preset"""
-    self.client.table('presets').delete().eq('id', preset_id).execute()
\ No newline at end of file
+    def list_presets(self, category=None, tag=None, search=None, user_id=None, limit=50, offset=0,
+                     after_likes=None, after_id=None):
+        """List presets with filters.
+
+        Ordered by likes_count (desc) then id. Pass the likes_count and id of the last
+        preset of a page as after_likes/after_id to fetch the next page without OFFSET.
+        """
+        query = self.client.table('presets').select('*').eq('is_public', True)
+
+        if category:
+            query = query.eq('category', category)
+        if tag:
+            query = query.contains('tags', [tag])
+        if search:
+            query = query.or_(f'name.ilike.%{search}%,description.ilike.%{search}%')
+        if user_id:
+            query = query.eq('user_id', user_id)
+
+        query = query.order('likes_count', desc=True).order('id')
+        if after_id is not None:
+            # keyset cursor: rows strictly after (after_likes, after_id) in the sort
+            # order. Both go into a PostgREST filter expression, so they are
+            # parsed first (ValueError if malformed) rather than interpolated raw
+            after_likes = int(after_likes)
+            after_id = UUID(str(after_id))
+            query = query.or_(f'likes_count.lt.{after_likes},and(likes_count.eq.{after_likes},id.gt.{after_id})')
+            query = query.limit(limit)
+        else:
+            query = query.range(offset, offset + limit - 1)
+        result = query.execute()
+        return result.data
+
+    def get_preset_by_id(self, preset_id: str):
+        """Get a specific preset"""
+        result = self.client.table('presets').select('*').eq('id', preset_id).single().execute()
+        return result.data
+
+    def has_user_liked_preset(self, preset_id: str, user_id: str):
+        """Check if user has liked a preset"""
+        result = self.client.table('preset_likes').select('id').eq('preset_id', preset_id).eq('user_id', user_id).limit(1).execute()
+        return bool(result.data)
+
+    def toggle_preset_like(self, preset_id: str, user_id: str):
+        """Toggle like on a preset"""
+        # single transactional RPC (migrations/002) instead of check + write + counter update
+        res = self.client.rpc('toggle_preset_like', {'p_preset_id': preset_id, 'p_user_id': user_id}).execute()
+        row = res.data[0] if isinstance(res.data, list) else res.data
+        return {'liked': row['liked'], 'likes_count': row['likes_count']}
+
+    def increment_preset_usage(self, preset_id: str):
+        """Increment usage count"""
+        self.client.rpc('increment_preset_usage', {'preset_id': preset_id}).execute()
+
+    def delete_preset(self, preset_id: str):
+        """Delete a preset"""
+        self.client.table('presets').delete().eq('id', preset_id).execute()
@@ -1,144 +1,383 @@
-from fastapi import FastAPI, Query, UploadFile, File, Form, HTTPException, Depends
+from fastapi import FastAPI, Query, UploadFile, File, Form, HTTPException, Depends, BackgroundTasks, Request
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 from typing import List, Optional
-from uuid import uuid4
+from uuid import UUID, uuid4
+import asyncio
+import aiofiles.os
 import os
 import platform
+import re
+import shutil
+import stat
 import sys
+import threading
+import time
 from pathlib import Path
 import docker
-import json
+import requests
 import mimetypes
+import orjson
 from .config import settings
 from .db import SupabaseClient
 from .security import get_current_user, verify_user_access, sanitize_filename
-from .ai_agent import get_agent
+from .ai_agent import ResponseFormat, get_agent, close_agent
+from .schemas import UploadResponse, UserDirectoryListing
+from .validation import validate_command
+from cachetools import TTLCache
 from datetime import datetime
+from functools import lru_cache
 
-app = FastAPI(title="refile-backend", version="0.1")
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # not Linux / not installed: new files are found by diffing folder snapshots
+    INotify = None
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Startup and shutdown hooks.
+    
+    Runs in every uvicorn worker process, so each worker warms up and
+    tears down its own Docker client, agent and Supabase pool.
+    """
+    # One Supabase client (and httpx pool) per process, created before any
+    # request can race to build it
+    try:
+        app.state.sb = SupabaseClient()
+    except Exception as e:
+        app.state.sb = None
+        print(f"Warning: could not create Supabase client: {e}")
+    
+    # Connect to Docker and make sure the image is present up front, so the
+    # first command doesn't pay for either
+    try:
+        await asyncio.to_thread(ensure_docker_image)
+    except HTTPException as e:
+        print(f"Warning: {e.detail}")
+    except docker.errors.DockerException as e:
+        print(f"Warning: could not pull Docker image '{DOCKER_IMAGE_NAME}': {e}")
+    
+    yield
+    
+    await close_agent()
+    await asyncio.to_thread(stop_user_containers)
+    await asyncio.to_thread(close_docker_client)
+    if app.state.sb is not None:
+        app.state.sb.close()
+
+
+app = FastAPI(title="refile-backend", version="0.1", lifespan=lifespan)
+
+# Explicit origins: browsers refuse "*" together with credentials, and a
+# fixed list lets preflights be cached for a day instead of repeated
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=[o.strip() for o in settings.CORS_ORIGINS.split(",") if o.strip()],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "DELETE"],
+    allow_headers=["x-user-id", "content-type"],
+    max_age=86400,
 )
 
-# ensure upload dir exists
-UPLOAD_ROOT = Path(settings.UPLOAD_DIR)
-UPLOAD_ROOT.mkdir(parents=True, exist_ok=True)
+# ensure upload dir exists; kept as an absolute, symlink-free str so request
+# paths are plain os.path.join calls (no Path objects, no resolve())
+UPLOAD_ROOT = os.path.realpath(settings.UPLOAD_DIR)
+os.makedirs(UPLOAD_ROOT, exist_ok=True)
+
+async def get_sb(request: Request) -> SupabaseClient:
+    """
+    Shared Supabase client (one connection pool per process, created in lifespan).
+    
+    Routes take it with Depends(get_sb), so tests can swap it through
+    app.dependency_overrides. It is async so FastAPI resolves it on the
+    event loop rather than through the threadpool.
+    """
+    sb = request.app.state.sb
+    if sb is None:
+        raise HTTPException(status_code=500, detail="Supabase client is not configured")
+    return sb
 
-sb = SupabaseClient()
 
+@lru_cache(maxsize=512)
+def guess_content_type(ext: str) -> str:
+    """Content type for a file extension (e.g. ".png"), defaulting to octet-stream."""
+    content_type, _ = mimetypes.guess_type("x" + ext)
+    return content_type or "application/octet-stream"
 
-def user_folder(user_id: str) -> Path:
-    p = UPLOAD_ROOT / user_id
-    p.mkdir(parents=True, exist_ok=True)
+
+# mkdir only has to happen once per user per process
+@lru_cache(maxsize=10_000)
+def user_folder(user_id: str) -> str:
+    p = os.path.join(UPLOAD_ROOT, user_id)
+    os.makedirs(p, exist_ok=True)
     return p
 
 # Docker configuration
 DOCKER_IMAGE_NAME = "my-base-image-clis"  # Configure this in your environment
 CONTAINER_MOUNT_PATH = "/data"
+# Per-user worker containers are removed after this many idle seconds
+CONTAINER_IDLE_TIMEOUT = 300
+# How much of a failed command's stderr is kept for the error message
+STDERR_TAIL_BYTES = 16 * 1024
+
+# host user dir -> [container, last used timestamp, execs in flight]
+_user_containers: dict = {}
+_user_containers_lock = threading.Lock()
+
+@lru_cache(maxsize=1)
+def _connect_docker():
+    client = docker.from_env()
+    client.ping()
+    return client
+
+# Serializes the first connect so concurrent requests share one client
+_docker_lock = threading.Lock()
 
 def get_docker_client():
-    """Connects to the Docker daemon."""
+    """Connects to the Docker daemon (the connection is reused between calls)."""
     try:
-        client = docker.from_env()
-        client.ping()
-        return client
+        with _docker_lock:
+            return _connect_docker()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Could not connect to Docker daemon: {str(e)}")
 
-def get_user_id():
-    """Gets the user:group ID to fix file permissions. Not supported on Windows."""
-    if platform.system() == "Windows":
+def ensure_docker_image():
+    """Pull DOCKER_IMAGE_NAME if it isn't in the local image store yet."""
+    client = get_docker_client()
+    try:
+        client.images.get(DOCKER_IMAGE_NAME)
+    except docker.errors.ImageNotFound:
+        client.images.pull(DOCKER_IMAGE_NAME)
+
+def reset_docker_client():
+    """Drop the cached Docker client so the next call reconnects."""
+    with _docker_lock:
+        _connect_docker.cache_clear()
+
+def close_docker_client():
+    """Close the cached Docker client, if one was ever created."""
+    with _docker_lock:
+        if _connect_docker.cache_info().currsize:
+            _connect_docker().close()
+            _connect_docker.cache_clear()
+
+# user:group the container commands run as, so outputs are owned by this
+# process's user (not supported on Windows)
+DOCKER_USER = None if platform.system() == "Windows" else f"{os.getuid()}:{os.getgid()}"
+
+def _reap_idle_containers(now: float):
+    """Remove worker containers that haven't run a command for CONTAINER_IDLE_TIMEOUT."""
+    with _user_containers_lock:
+        # A container with an exec in flight is never idle, however long
+        # that command (e.g. a transcode) has been running
+        idle = [key for key, (_, last_used, in_flight) in _user_containers.items()
+                if not in_flight and now - last_used > CONTAINER_IDLE_TIMEOUT]
+        containers = [_user_containers.pop(key)[0] for key in idle]
+    for container in containers:
+        try:
+            container.remove(force=True)
+        except (docker.errors.DockerException, requests.exceptions.RequestException):
+            pass
+
+def get_user_container(client, user_dir_absolute: str, user_id: Optional[str], environment: dict):
+    """
+    Get the long-running worker container for a user directory.
+    
+    The container is started once with the directory mounted and just sleeps;
+    commands are run in it with exec, which skips the container start-up
+    cost on every request.
+    
+    The container is marked as busy until release_user_container is called,
+    so it isn't reaped while the caller's exec runs.
+    """
+    now = time.monotonic()
+    _reap_idle_containers(now)
+    
+    key = str(user_dir_absolute)
+    with _user_containers_lock:
+        entry = _user_containers.get(key)
+        if entry is not None:
+            entry[1] = now
+            entry[2] += 1
+            return entry[0]
+    
+    container = client.containers.run(
+        DOCKER_IMAGE_NAME,
+        command="sleep infinity",
+        detach=True,
+        auto_remove=True,
+        volumes={key: {'bind': CONTAINER_MOUNT_PATH, 'mode': 'rw'}},
+        # Scratch space in memory: tools' temp files never reach the host disk
+        tmpfs={'/tmp': 'rw,size=512m,mode=1777'},
+        user=user_id,
+        environment=environment,
+        working_dir=CONTAINER_MOUNT_PATH
+    )
+    with _user_containers_lock:
+        existing = _user_containers.get(key)
+        if existing is None:
+            _user_containers[key] = [container, now, 1]
+            return container
+        existing[2] += 1
+    # Another request started one at the same time; keep theirs
+    container.remove(force=True)
+    return existing[0]
+
+def release_user_container(user_dir_absolute: str, container):
+    """Mark an exec started via get_user_container as finished; the idle timer restarts now."""
+    with _user_containers_lock:
+        entry = _user_containers.get(str(user_dir_absolute))
+        # The entry may have been discarded (and replaced) meanwhile
+        if entry is not None and entry[0] is container:
+            entry[1] = time.monotonic()
+            entry[2] -= 1
+
+def run_in_user_container(client, user_dir_absolute: str, command, user_id: Optional[str], environment: dict):
+    """exec_in_container in the user's worker container, holding it busy for the duration."""
+    container = get_user_container(client, user_dir_absolute, user_id, environment)
+    try:
+        return exec_in_container(container, command, user_id, environment)
+    finally:
+        release_user_container(user_dir_absolute, container)
+
+def discard_user_container(user_dir_absolute: str, container, gone: bool = False):
+    """
+    Forget (and remove) a user's worker container after an exec into it failed.
+    
+    A container that still has execs in flight is left alone unless it is
+    really gone (gone=True), so one request's error can't kill another's
+    running command.
+    """
+    key = str(user_dir_absolute)
+    with _user_containers_lock:
+        entry = _user_containers.get(key)
+        # Already replaced, or still busy and apparently alive
+        if entry is None or entry[0] is not container or (entry[2] and not gone):
+            return
+        del _user_containers[key]
+    # A dead one may still exist stopped (409), so remove it either way
+    try:
+        container.remove(force=True)
+    except (docker.errors.DockerException, requests.exceptions.RequestException):
+        pass
+
+def stop_user_containers():
+    """Remove all worker containers (called on shutdown)."""
+    with _user_containers_lock:
+        containers = [entry[0] for entry in _user_containers.values()]
+        _user_containers.clear()
+    for container in containers:
+        try:
+            container.remove(force=True)
+        except (docker.errors.DockerException, requests.exceptions.RequestException):
+            pass
+
+# Stored files are named "<uuid4 hex><ext>" (older ones use the hyphenated form)
+_UUID_RE = re.compile(r'[0-9a-fA-F]{32}|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+
+def list_file_names(directory) -> set:
+    """Names of the regular files in a directory (dirent types only, no stat per entry)."""
+    with os.scandir(directory) as it:
+        return {entry.name for entry in it if entry.is_file(follow_symlinks=False)}
+
+def open_folder_watch(directory):
+    """Start an inotify watch for entries created in (or moved into) a folder; None if unavailable."""
+    if INotify is None:
+        return None
+    try:
+        watcher = INotify()
+    except OSError:
         return None
-    return f"{os.getuid()}:{os.getgid()}"
+    try:
+        watcher.add_watch(os.fspath(directory), inotify_flags.CREATE | inotify_flags.MOVED_TO)
+    except OSError:  # e.g. out of watches
+        watcher.close()
+        return None
+    return watcher
 
-def validate_command(command: str) -> tuple[bool, str]:
+def collect_watched_files(watcher, directory, exclude: List[str], since_ns: int) -> List[str]:
     """
-    Validate that a command has proper arguments and is not just showing help.
-    Handles chained commands with && operators.
+    New regular files in a watched folder, read from the queued inotify events.
     
-    Args:
-        command: The Linux command to validate (may contain && for chaining)
-        
-    Returns:
-        Tuple of (is_valid, error_message)
-    """
-    command = command.strip()
-    
-    # Check if command is empty
-    if not command:
-        return False, "Command is empty"
-    
-    # Split by && to handle chained commands
-    command_parts = [part.strip() for part in command.split('&&') if part.strip()]
-    
-    if len(command_parts) == 0:
-        return False, "Command has no parts"
-    
-    # Validate each command in the chain
-    for cmd_part in command_parts:
-        # Skip validation for shell loops and control structures
-        if cmd_part.startswith('for ') or cmd_part.startswith('while ') or cmd_part.startswith('if '):
-            continue  # Complex shell constructs are allowed
-        
-        # Split command to get the base command and arguments
-        parts = cmd_part.split()
-        if len(parts) == 0:
-            continue
-        
-        base_cmd = parts[0]
-        
-        # Commands that require specific arguments
-        commands_needing_args = {
-            'pdftocairo': ['input.pdf', 'output'],
-            'pdftotext': ['input.pdf'],
-            'pdfimages': ['input.pdf', 'prefix'],
-            'pdfinfo': ['input.pdf'],
-            'ffmpeg': ['-i'],
-            'convert': ['input'],
-            'mogrify': ['input'],
-            'tesseract': ['input', 'output'],
-        }
-        
-        # Check if this command requires arguments
-        if base_cmd in commands_needing_args:
-            # For pdftocairo specifically, check for output format flags
-            if base_cmd == 'pdftocairo':
-                has_format = any(flag in cmd_part for flag in ['-png', '-jpeg', '-pdf', '-svg', '-tiff', '-ps', '-eps'])
-                if not has_format:
-                    return False, f"pdftocairo command missing output format flag (-png, -jpeg, -pdf, etc.)"
-                
-                # Check for input/output files (at least 2 arguments after flags)
-                non_flag_args = [p for p in parts[1:] if not p.startswith('-')]
-                if len(non_flag_args) < 2:
-                    return False, f"pdftocairo command missing input PDF and/or output file arguments"
-            
-            # For ffmpeg, check for -i flag
-            elif base_cmd == 'ffmpeg':
-                if '-i' not in cmd_part:
-                    return False, "ffmpeg command missing -i input file flag"
-            
-            # For mogrify, it can work with wildcards, so be lenient
-            elif base_cmd == 'mogrify':
-                if len(parts) < 2:
-                    return False, f"mogrify command appears to be missing required arguments"
-            
-            # Generic check for minimum number of arguments
-            elif len(parts) < 2:
-                return False, f"{base_cmd} command appears to be missing required arguments"
+    Entries that were removed again (temp files) are dropped, as are the
+    command's input files: tools that rewrite a file in place rename a temp
+    file over it. If the event queue overflowed, fall back to the files
+    modified since since_ns.
+    """
+    directory = os.fspath(directory)
+    events = watcher.read(timeout=0)
+    if any(event.mask & inotify_flags.Q_OVERFLOW for event in events):
+        with os.scandir(directory) as entries:
+            names = {entry.name for entry in entries
+                     if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime_ns >= since_ns}
+    else:
+        names = {event.name for event in events if event.name}
+    
+    new_files = []
+    for name in names.difference(exclude):
+        try:
+            if stat.S_ISREG(os.lstat(os.path.join(directory, name)).st_mode):
+                new_files.append(name)
+        except FileNotFoundError:
+            pass
+    return new_files
+
+class ExecNotStarted(Exception):
+    """exec_create failed, so the command never ran and is safe to retry."""
+    def __init__(self, container, error: Exception):
+        super().__init__(str(error))
+        self.container = container
+        self.error = error
+    
+    @property
+    def container_gone(self) -> bool:
+        """True if the container no longer exists or isn't running."""
+        return isinstance(self.error, docker.errors.NotFound) or (
+            isinstance(self.error, docker.errors.APIError) and self.error.status_code == 409
+        )
+
+def exec_in_container(container, command, user_id: Optional[str], environment: dict) -> tuple[int, bytes]:
+    """
+    Run a command in a worker container and return (exit_code, stderr tail).
+    
+    stdout is not attached, so Docker discards it; stderr is streamed and
+    only the last STDERR_TAIL_BYTES are kept for the error message.
     
-    return True, ""
+    Raises:
+        ExecNotStarted: If the exec couldn't be created; errors after that
+            propagate as-is, since the command may already have run partly
+    """
+    api = container.client.api
+    try:
+        exec_id = api.exec_create(
+            container.id,
+            command,
+            stdout=False,
+            stderr=True,
+            user=user_id or "",
+            workdir=CONTAINER_MOUNT_PATH,
+            environment=environment
+        )["Id"]
+    except (docker.errors.APIError, requests.exceptions.ConnectionError) as e:
+        raise ExecNotStarted(container, e) from e
+    
+    stderr_tail = bytearray()
+    for _, stderr in api.exec_start(exec_id, stream=True, demux=True):
+        if stderr:
+            stderr_tail += stderr
+            if len(stderr_tail) > STDERR_TAIL_BYTES:
+                del stderr_tail[:-STDERR_TAIL_BYTES]
+    
+    return api.exec_inspect(exec_id)["ExitCode"], bytes(stderr_tail)
 
-def execute_command_in_docker(user_dir: Path, linux_command: str, input_files: List[str]) -> List[str]:
+def execute_command_in_docker(user_dir: str, linux_command: str, input_files: List[str]) -> List[str]:
     """
-    Execute a Linux command in a Docker container with user directory mounted.
-    If multiple commands are detected (separated by && or newlines), they will be
-    executed sequentially one after the other.
+    Execute a Linux command in the user's worker container (user directory
+    mounted at CONTAINER_MOUNT_PATH).
+    Multiple commands (separated by && or newlines) are run by a single
+    /bin/sh -c invocation.
     
     Args:
         user_dir: Path to user's upload directory
@@ -158,43 +397,30 @@ def execute_command_in_docker(user_dir: Path, linux_command: str, input_files: L
     
     client = get_docker_client()
     
-    # Get list of files before execution
-    files_before = set()
-    if user_dir.exists():
-        files_before = {f.name for f in user_dir.iterdir() if f.is_file()}
-    
-    # Convert to absolute path and resolve any symlinks
-    user_dir_absolute = user_dir.resolve()
+    # Track what the command creates. With inotify only the new entries are
+    # reported, so the folder doesn't have to be listed up front
+    started_ns = time.time_ns()
+    dir_exists = os.path.isdir(user_dir)
+    watcher = open_folder_watch(user_dir) if dir_exists else None
+    if watcher is None:
+        # Get list of files before execution
+        # The folder's mtime changes whenever an entry is added or removed, so
+        # if it is unchanged after the run there can't be any new files
+        dir_mtime_before = os.stat(user_dir).st_mtime_ns if dir_exists else None
+        files_before = list_file_names(user_dir) if dir_mtime_before is not None else set()
     
-    # Prepare container run arguments with absolute host path
-    volumes_dict = {
-        str(user_dir_absolute): {
-            'bind': CONTAINER_MOUNT_PATH,
-            'mode': 'rw'
-        }
-    }
+    # user_folder paths are already absolute and symlink-free (UPLOAD_ROOT is realpath'd)
+    user_dir_absolute = user_dir
     
-    user_id = get_user_id()
+    user_id = DOCKER_USER
     
     # Set up environment variables for LibreOffice and other tools
     environment = {
         'HOME': '/tmp',  # Use /tmp as home directory
+        'TMPDIR': '/tmp',  # Temp files go to the container's tmpfs, not the bind mount
         'SAL_USE_VCLPLUGIN': 'svp',  # Use headless backend for LibreOffice
     }
     
-    # Check if command contains shell features that require /bin/sh -c
-    needs_shell = any([
-        '&&' in linux_command,  # Command chaining
-        '||' in linux_command,  # Or operator
-        '|' in linux_command and '|' not in '||',  # Pipes (but not ||)
-        'for ' in linux_command,  # For loops
-        'while ' in linux_command,  # While loops
-        '*' in linux_command,  # Wildcards
-        '?' in linux_command,  # Wildcards
-        '$(' in linux_command,  # Command substitution
-        '`' in linux_command,  # Command substitution
-    ])
-    
     try:
         # Add LibreOffice-specific options if needed
         cmd = linux_command.strip()
@@ -209,49 +435,58 @@ def execute_command_in_docker(user_dir: Path, linux_command: str, input_files: L
                 # Use a temporary user profile in /tmp
                 cmd = cmd.replace('--headless', '--headless -env:UserInstallation=file:///tmp/libreoffice_profile', 1)
         
-        # Prepare command for Docker
-        if needs_shell:
-            # Use shell to execute complex commands
-            docker_command = ['/bin/sh', '-c', cmd]
-        else:
-            # Execute simple commands directly
-            docker_command = cmd
-        
-        # Run command in the container
-        container_logs = client.containers.run(
-            DOCKER_IMAGE_NAME,
-            command=docker_command,
-            remove=True,
-            volumes=volumes_dict,
-            user=user_id,
-            environment=environment,
-            stdout=True,
-            stderr=True,
-            working_dir=CONTAINER_MOUNT_PATH
-        )
+        # Always hand the whole command to one shell: chained commands (&&, ;,
+        # newlines), pipes, globs and loops then run in a single exec
+        docker_command = ['/bin/sh', '-c', cmd]
+        
+        # Run command in the user's worker container; if the exec couldn't
+        # even be created (container went away, daemon restart, connection
+        # dropped), reconnect, get a fresh container and retry once. Failures
+        # after the exec started aren't retried: the command may have partly
+        # run (renames, outputs)
+        try:
+            exit_code, stderr = run_in_user_container(client, user_dir_absolute, docker_command, user_id, environment)
+        except ExecNotStarted as e:
+            discard_user_container(user_dir_absolute, e.container, gone=e.container_gone)
+            reset_docker_client()
+            client = get_docker_client()
+            exit_code, stderr = run_in_user_container(client, user_dir_absolute, docker_command, user_id, environment)
+        
+        if exit_code != 0:
+            error_msg = stderr.decode('utf-8', errors='replace').strip() if stderr else "Command failed"
+            raise HTTPException(status_code=400, detail=f"Docker command failed: {error_msg}")
+        
+        if watcher is not None:
+            return collect_watched_files(watcher, user_dir, input_files, started_ns)
         
         # Get list of files after execution
-        files_after = set()
-        if user_dir.exists():
-            files_after = {f.name for f in user_dir.iterdir() if f.is_file()}
+        if dir_mtime_before is not None and os.stat(user_dir).st_mtime_ns == dir_mtime_before:
+            return []
+        files_after = list_file_names(user_dir) if os.path.isdir(user_dir) else set()
         
         # Find newly created files
         new_files = list(files_after - files_before)
         
         return new_files
         
-    except docker.errors.ContainerError as e:
-        error_msg = e.stderr.decode('utf-8').strip() if e.stderr else "Command failed"
-        raise HTTPException(status_code=400, detail=f"Docker command failed: {error_msg}")
+    except HTTPException:
+        raise
     except docker.errors.ImageNotFound:
         raise HTTPException(status_code=500, detail=f"Docker image '{DOCKER_IMAGE_NAME}' not found")
     except Exception as e:
+        # The daemon may have restarted; reconnect on the next request
+        reset_docker_client()
         raise HTTPException(status_code=500, detail=f"Docker execution error: {str(e)}")
+    finally:
+        if watcher is not None:
+            watcher.close()
 
-def register_generated_files(user_dir: Path, new_file_names: List[str], user_id: str) -> List[dict]:
+async def register_generated_files(user_dir: str, new_file_names: List[str], user_id: str) -> List[dict]:
     """
     Register newly generated files using the same logic as /api/upload
     
+    The renames are independent, so they run concurrently.
+    
     Args:
         user_dir: Path to user's upload directory
         new_file_names: List of newly created filenames
@@ -260,42 +495,32 @@ def register_generated_files(user_dir: Path, new_file_names: List[str], user_id:
     Returns:
         List of file metadata with UUIDs
     """
-    registered_files = []
-    
-    for filename in new_file_names:
-        file_path = user_dir / filename
+    async def register_one(filename: str) -> Optional[dict]:
+        # Generate UUID and new filename like upload route
+        ext = os.path.splitext(filename)[1]
+        file_id = uuid4().hex
+        new_filename = f"{file_id}{ext}"
         
-        if file_path.exists():
-            # Generate UUID and new filename like upload route
-            ext = file_path.suffix
-            file_id = str(uuid4())
-            new_filename = f"{file_id}{ext}"
-            dest = user_dir / new_filename
-            
-            # Rename file to UUID format
-            file_path.rename(dest)
-            
-            # Get content type
-            content_type, _ = mimetypes.guess_type(str(dest))
-            if not content_type:
-                content_type = "application/octet-stream"
-            
-            # Create file metadata with correct path format
-            relative_path = f"user_uploads/{user_id}/{new_filename}"
-            
-            file_info = {
-                "id": file_id,
-                "original_filename": filename,
-                "stored_filename": new_filename,
-                "content_type": content_type,
-                "path": relative_path,
-            }
-            
-            registered_files.append(file_info)
+        # Rename file to UUID format; a file that's already gone just isn't
+        # registered (no separate existence check)
+        try:
+            await aiofiles.os.rename(os.path.join(user_dir, filename), os.path.join(user_dir, new_filename))
+        except FileNotFoundError:
+            return None
+        
+        # Create file metadata with correct path format
+        return {
+            "id": file_id,
+            "original_filename": filename,
+            "stored_filename": new_filename,
+            "content_type": guess_content_type(ext),
+            "path": f"user_uploads/{user_id}/{new_filename}",
+        }
     
-    return registered_files
+    registered = await asyncio.gather(*(register_one(filename) for filename in new_file_names))
+    return [file_info for file_info in registered if file_info is not None]
 
-def map_files_to_stored_names(user_dir: Path, file_identifiers: List[str]) -> List[str]:
+def map_files_to_stored_names(user_dir: str, file_identifiers: List[str]) -> List[str]:
     """
     Map file identifiers to actual stored filenames.
     file_identifiers can be either:
@@ -305,34 +530,26 @@ def map_files_to_stored_names(user_dir: Path, file_identifiers: List[str]) -> Li
     """
     files_list = []
     
+    # Index the folder once instead of rescanning it per identifier
+    stored_names = list_file_names(user_dir) if os.path.isdir(user_dir) else set()
+    by_id = {}
+    by_ext = {}
+    for name in sorted(stored_names):
+        by_id.setdefault(name.partition('.')[0], name)
+        by_ext.setdefault(os.path.splitext(name)[1].lower(), name)
+    
     for identifier in file_identifiers:
-        stored_filename = None
-        
-        # Check if it's already a stored filename (contains UUID pattern)
-        if len(identifier.split('.')[0]) == 36:  # UUID length
+        if identifier in stored_names:
+            # Already a stored filename
             stored_filename = identifier
+        elif _UUID_RE.match(identifier):
+            # A file ID (or a stored name that no longer exists)
+            stored_filename = by_id.get(identifier)
         else:
-            # Try to find by file ID (if just UUID provided)
-            try:
-                # Check if it's a UUID
-                if len(identifier) == 36 and '-' in identifier:
-                    # Look for files starting with this UUID
-                    for f in user_dir.iterdir():
-                        if f.is_file() and f.name.startswith(identifier):
-                            stored_filename = f.name
-                            break
-            except:
-                pass
-            
             # Fallback: extension matching (original problematic logic)
-            if not stored_filename:
-                original_ext = Path(identifier).suffix.lower()
-                matching_files = [f for f in user_dir.iterdir() 
-                                if f.is_file() and f.suffix.lower() == original_ext]
-                if matching_files:
-                    stored_filename = matching_files[0].name
-        
-        if stored_filename and (user_dir / stored_filename).exists():
+            stored_filename = by_ext.get(Path(identifier).suffix.lower())
+        
+        if stored_filename:
             files_list.append(stored_filename)
         else:
             # Log warning and skip
@@ -340,7 +557,15 @@ def map_files_to_stored_names(user_dir: Path, file_identifiers: List[str]) -> Li
     
     return files_list
 
-@app.post("/api/upload")
+# How many files of one upload request are written concurrently
+UPLOAD_SAVE_CONCURRENCY = 4
+
+def save_upload(source, dest: str):
+    """Copy an upload's spooled file to dest in 1 MiB chunks (blocking; run in a thread)."""
+    with open(dest, "wb") as f:
+        shutil.copyfileobj(source, f, 1 << 20)
+
+@app.post("/api/upload", response_model=UploadResponse)
 async def upload_file(
     files: List[UploadFile] = File(...),
     current_user: str = Depends(get_current_user)
@@ -354,33 +579,36 @@ async def upload_file(
     """
     user_id = current_user  # Use authenticated user, not client-provided
     
-    # Save all files
-    uploaded_files_info = []
-    original_filenames = []
+    user_dir = user_folder(user_id)
+    
+    # At most 4 files are written at a time, so a large batch can't tie up
+    # the whole threadpool or run out of file descriptors
+    save_slots = asyncio.Semaphore(UPLOAD_SAVE_CONCURRENCY)
     
-    for file in files:
+    async def save_one(file: UploadFile) -> dict:
         # Save file with UUID name for security
-        ext = Path(file.filename).suffix
-        file_id = str(uuid4())
+        ext = os.path.splitext(file.filename)[1]
+        file_id = uuid4().hex
         filename = f"{file_id}{ext}"
-        dest = user_folder(user_id) / filename
+        dest = os.path.join(user_dir, filename)
 
-        with open(dest, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # Copy in a worker thread: one thread hop per file instead of two per chunk
+        async with save_slots:
+            await asyncio.to_thread(save_upload, file.file, dest)
         
         # Create correct relative path
         relative_path = f"user_uploads/{user_id}/{filename}"
         
-        uploaded_files_info.append({
+        return {
             "id": file_id,
             "original_filename": file.filename,
             "stored_filename": filename,  # UUID-based filename
             "content_type": file.content_type,
             "path": relative_path,
-        })
-        
-        original_filenames.append(file.filename)
+        }
+    
+    # Save all files concurrently so their disk writes overlap
+    uploaded_files_info = await asyncio.gather(*(save_one(file) for file in files))
 
     return {
         "status": "ok", 
@@ -393,9 +621,16 @@ async def upload_file(
 @app.get("/api/list/{user_id}")
 def list_user_files(
     user_id: str,
+    before: Optional[datetime] = Query(None),
+    before_id: Optional[UUID] = Query(None),
+    limit: int = Query(50, ge=1, le=100),
+    sb: SupabaseClient = Depends(get_sb),
     current_user: str = Depends(get_current_user)
 ):
-    """List saved prompts/files for a user from Supabase.
+    """List saved prompts/files for a user from Supabase, newest first.
+    
+    Results are paginated: pass the returned next_cursor as `before` and
+    next_cursor_id as `before_id` to get the next page.
     
     Security: Users can only list their own files.
     """
@@ -403,10 +638,47 @@ def list_user_files(
     verify_user_access(current_user, user_id)
     
     try:
-        rows = sb.get_prompts_for_user(user_id)
+        rows = sb.get_prompts_for_user(user_id, before=before, before_id=before_id, limit=limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"db error: {e}")
-    return {"status": "ok", "items": rows}
+    last = rows[-1] if len(rows) == limit else None
+    return {
+        "status": "ok",
+        "items": rows,
+        "next_cursor": last["created_at"] if last else None,
+        "next_cursor_id": last["id"] if last else None,
+    }
+
+
+def user_file_response(user_id: str, filename: str) -> FileResponse:
+    """
+    Build the response for a file in the user's folder.
+    
+    Shared by /api/download and /files; callers must already have checked
+    access. Path traversal protection is applied to the filename.
+    """
+    # Sanitize filename to prevent path traversal
+    safe_filename = sanitize_filename(filename)
+    
+    path = os.path.join(user_folder(user_id), safe_filename)
+    
+    # The sanitized name has no separators, so the path is directly inside the
+    # user folder; lstat (no symlink following) plus the regular-file check
+    # keeps symlinks from pointing it elsewhere, without a resolve()
+    try:
+        stat_result = os.lstat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    # Hand over the stat we already did so FileResponse doesn't stat again
+    return FileResponse(
+        path,
+        filename=safe_filename,
+        media_type=guess_content_type(os.path.splitext(safe_filename)[1]),
+        stat_result=stat_result
+    )
 
 
 @app.get("/api/download/{user_id}/{stored_filename}")
@@ -423,23 +695,7 @@ def download_file(
     # Verify user can only access their own files
     verify_user_access(current_user, user_id)
     
-    # Sanitize filename to prevent path traversal
-    safe_filename = sanitize_filename(stored_filename)
-    
-    path = UPLOAD_ROOT / user_id / safe_filename
-    
-    # Additional security: ensure resolved path is within user folder
-    try:
-        path = path.resolve()
-        user_folder_path = (UPLOAD_ROOT / user_id).resolve()
-        if not str(path).startswith(str(user_folder_path)):
-            raise HTTPException(status_code=403, detail="Access denied")
-    except Exception:
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    if not path.exists():
-        raise HTTPException(status_code=404, detail="file not found")
-    return FileResponse(path, filename=safe_filename)
+    return user_file_response(user_id, stored_filename)
 
 
 @app.delete("/api/delete/{user_id}/{file_id}")
@@ -458,25 +714,31 @@ def delete_file(
     # Verify user can only access their own files
     verify_user_access(current_user, user_id)
     
+    # Stored files are named after a UUID; anything else can't match, so
+    # reject it before touching the filesystem (this also rules out traversal)
+    if not _UUID_RE.fullmatch(file_id):
+        raise HTTPException(status_code=400, detail="Invalid file_id")
+    
     # Get user folder
     user_dir = user_folder(user_id)
     
     # Find files matching the file_id pattern
     deleted_files = []
-    file_found = False
     
     try:
-        # List all files in user directory
-        for file_path in user_dir.iterdir():
-            if file_path.is_file():
-                # Check if filename starts with the file_id
-                if file_path.stem == file_id or file_path.name.startswith(f"{file_id}."):
+        # "<file_id>" (no extension) or "<file_id>.<ext>". A wildcard glob
+        # reads the whole directory anyway, so do that read once with
+        # scandir: the file type comes from the dirent and no Path objects
+        # are built
+        prefix = f"{file_id}."
+        with os.scandir(user_dir) as entries:
+            for entry in entries:
+                if (entry.name == file_id or entry.name.startswith(prefix)) and entry.is_file(follow_symlinks=False):
                     # Delete the file
-                    file_path.unlink()
-                    deleted_files.append(file_path.name)
-                    file_found = True
+                    os.unlink(entry.path)
+                    deleted_files.append(entry.name)
         
-        if not file_found:
+        if not deleted_files:
             raise HTTPException(status_code=404, detail=f"File with ID '{file_id}' not found")
         
         return {
@@ -500,6 +762,7 @@ def health():
 @app.get("/api/status/{prompt_id}")
 def get_prompt_status(
     prompt_id: str,
+    sb: SupabaseClient = Depends(get_sb),
     current_user: str = Depends(get_current_user)
 ):
     """Get the processing status of a prompt/file upload.
@@ -560,21 +823,19 @@ async def process_prompt(
     Returns:
         AI-generated command and metadata
     """
-    import json
-    
     user_id = current_user
     
     # Parse uploaded files list - now contains UUIDs/stored filenames
     try:
-        files_list = json.loads(uploaded_files) if uploaded_files else []
-    except:
+        files_list = orjson.loads(uploaded_files) if uploaded_files else []
+    except orjson.JSONDecodeError:
         files_list = [uploaded_files] if uploaded_files else []
     
     # Validate that the files exist in user's directory
     user_dir = user_folder(user_id)
     validated_files = []
     for filename in files_list:
-        if (user_dir / filename).exists():
+        if os.path.exists(os.path.join(user_dir, filename)):
             validated_files.append(filename)
         else:
             print(f"Warning: File '{filename}' not found in user directory")
@@ -584,26 +845,15 @@ async def process_prompt(
     # Build previous result if provided
     previous_result = None
     if previous_command:
-        from dataclasses import dataclass
-        from .ai_agent import ResponseFormat
-        
-        @dataclass
-        class PrevResponse:
-            linux_command: str
-            command_template: str
-            input_files: list
-            output_files: list
-            description: str
-        
         try:
-            prev_input = json.loads(previous_input_files) if previous_input_files else []
-            prev_output = json.loads(previous_output_files) if previous_output_files else []
-        except:
+            prev_input = orjson.loads(previous_input_files) if previous_input_files else []
+            prev_output = orjson.loads(previous_output_files) if previous_output_files else []
+        except orjson.JSONDecodeError:
             prev_input = []
             prev_output = []
             
         previous_result = {
-            'structured_response': PrevResponse(
+            'structured_response': ResponseFormat(
                 linux_command=previous_command,
                 command_template=previous_command_template or previous_command,
                 input_files=prev_input,
@@ -615,7 +865,7 @@ async def process_prompt(
     # Process with AI agent
     try:
         agent = get_agent()
-        ai_response = agent.process_request(
+        ai_response = await agent.process_request(
             user_prompt=prompt,
             uploaded_files=files_list,
             user_id=user_id,
@@ -635,10 +885,13 @@ async def process_prompt(
         # Execute the command in Docker
         if ai_result["linux_command"]:
             user_dir = user_folder(user_id)
-            new_files = execute_command_in_docker(user_dir, ai_result["linux_command"], ai_result["input_files"])
+            # Docker and filesystem calls block, so run them off the event loop
+            new_files = await asyncio.to_thread(
+                execute_command_in_docker, user_dir, ai_result["linux_command"], ai_result["input_files"]
+            )
             
             # Register new files
-            new_files_metadata = register_generated_files(user_dir, new_files, user_id)
+            new_files_metadata = await register_generated_files(user_dir, new_files, user_id)
             
             ai_result["output_files"] = new_files_metadata
         
@@ -649,7 +902,7 @@ async def process_prompt(
 
 
 @app.get("/files/{user_id}/{filename}")
-async def download_file(
+def serve_user_file(
     user_id: str, 
     filename: str,
     current_user: str = Depends(get_current_user)
@@ -660,38 +913,11 @@ async def download_file(
     # Verify user access
     verify_user_access(current_user, user_id)
     
-    # Sanitize the filename to prevent path traversal
-    safe_filename = sanitize_filename(filename)
-    
-    # Construct file path
-    user_dir = user_folder(user_id)
-    file_path = user_dir / safe_filename
-    
-    # Check if file exists
-    if not file_path.exists() or not file_path.is_file():
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    # Check if file is within user directory (extra security)
-    try:
-        file_path.resolve().relative_to(user_dir.resolve())
-    except ValueError:
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    # Determine content type
-    content_type, _ = mimetypes.guess_type(str(file_path))
-    if content_type is None:
-        content_type = 'application/octet-stream'
-    
-    # Return the file
-    return FileResponse(
-        path=str(file_path),
-        filename=safe_filename,
-        media_type=content_type
-    )
+    return user_file_response(user_id, filename)
 
 
-@app.get("/files/{user_id}")
-async def list_user_files(
+@app.get("/files/{user_id}", response_model=UserDirectoryListing)
+def list_user_directory(
     user_id: str,
     current_user: str = Depends(get_current_user)
 ):
@@ -703,22 +929,37 @@ async def list_user_files(
     
     user_dir = user_folder(user_id)
     
-    if not user_dir.exists():
+    if not os.path.isdir(user_dir):
         return {"files": []}
     
-    files = []
-    for file_path in user_dir.iterdir():
-        if file_path.is_file():
-            stat = file_path.stat()
-            files.append({
-                "filename": file_path.name,
-                "size": stat.st_size,
-                "modified": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                "download_url": f"/files/{user_id}/{file_path.name}"
-            })
+    # One pass over the directory: the file type comes from the dirent and
+    # DirEntry.stat() is cached, so each file costs at most one stat
+    with os.scandir(user_dir) as entries:
+        files = [
+            {
+                "filename": entry.name,
+                "size": (entry_stat := entry.stat()).st_size,
+                "modified": datetime.fromtimestamp(entry_stat.st_mtime).isoformat(),
+                "download_url": f"/files/{user_id}/{entry.name}"
+            }
+            for entry in entries if entry.is_file()
+        ]
     
     return {"files": files}
 
+_TEMPLATE_VAR_RE = re.compile(r'\{([^{}\s]+)\}')
+
+
+def substitute_template(template: str, variables: dict) -> str:
+    """
+    Replace {name} placeholders in one pass; unknown names are left as-is.
+    
+    (str.format_map isn't usable here: templates are shell commands, which
+    can contain other braces.)
+    """
+    return _TEMPLATE_VAR_RE.sub(lambda m: variables.get(m.group(1), m.group(0)), template)
+
+
 def render_preset_command(
     command_template: str,
     input_mappings: dict,
@@ -735,38 +976,45 @@ def render_preset_command(
     Returns:
         Tuple of (rendered_command, list_of_output_filenames)
     """
-    rendered_command = command_template
-    output_files = []
-    
-    # Replace input variables
-    for var_name, actual_filename in input_mappings.items():
-        rendered_command = rendered_command.replace(f"{{{var_name}}}", actual_filename)
+    # One timestamp per request, so every output of a run gets the same one
+    first_input = next(iter(input_mappings.values()), "output")
+    input_path = Path(first_input)
+    output_variables = {
+        "input_basename": input_path.stem,
+        "input_ext": input_path.suffix,
+        "timestamp": datetime.now().strftime("%Y%m%d_%H%M%S"),
+    }
     
     # Generate output filenames from patterns
+    command_variables = dict(input_mappings)
+    output_files = []
     for output_pattern in output_patterns:
-        pattern_template = output_pattern.get("template", "")
-        
-        # Replace special variables in output pattern
-        output_filename = pattern_template
-        
-        # Get first input file for basename/extension extraction
-        first_input = list(input_mappings.values())[0] if input_mappings else "output"
-        input_path = Path(first_input)
-        
-        # Replace template variables
-        output_filename = output_filename.replace("{input_basename}", input_path.stem)
-        output_filename = output_filename.replace("{input_ext}", input_path.suffix)
-        output_filename = output_filename.replace("{timestamp}", datetime.now().strftime("%Y%m%d_%H%M%S"))
-        
+        output_filename = substitute_template(output_pattern.get("template", ""), output_variables)
         output_files.append(output_filename)
-        
-        # Replace in command
-        var_name = output_pattern.get("name", "output_file")
-        rendered_command = rendered_command.replace(f"{{{var_name}}}", output_filename)
+        # Input variables win if a pattern reuses one of their names
+        command_variables.setdefault(output_pattern.get("name", "output_file"), output_filename)
     
+    rendered_command = substitute_template(command_template, command_variables)
     return rendered_command, output_files
 
 
+# Presets rarely change, so execute/delete read them through a short TTL cache
+_preset_cache = TTLCache(maxsize=1024, ttl=60)
+_preset_cache_lock = threading.Lock()
+
+
+def get_preset_cached(sb: SupabaseClient, preset_id: str) -> Optional[dict]:
+    """sb.get_preset_by_id, cached for 60s (missing presets are not cached)."""
+    with _preset_cache_lock:
+        preset = _preset_cache.get(preset_id)
+    if preset is None:
+        preset = sb.get_preset_by_id(preset_id)
+        if preset:
+            with _preset_cache_lock:
+                _preset_cache[preset_id] = preset
+    return preset
+
+
 # ============= PRESET ROUTES =============
 
 @app.post("/api/presets")
@@ -780,6 +1028,7 @@ async def create_preset(
     tags: str = Form("[]"),  # JSON array string
     tool: str = Form(...),
     is_public: bool = Form(True),
+    sb: SupabaseClient = Depends(get_sb),
     current_user: str = Depends(get_current_user)
 ):
     """
@@ -792,10 +1041,10 @@ async def create_preset(
     [{"name": "output_file", "template": "{input_basename}_grayscale{input_ext}", "description": "Grayscale image"}]
     """
     try:
-        input_patterns = json.loads(input_file_patterns)
-        output_patterns = json.loads(output_file_patterns)
-        tags_list = json.loads(tags)
-    except json.JSONDecodeError:
+        input_patterns = orjson.loads(input_file_patterns)
+        output_patterns = orjson.loads(output_file_patterns)
+        tags_list = orjson.loads(tags)
+    except orjson.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid JSON in patterns or tags")
     
     preset_data = {
@@ -804,15 +1053,15 @@ async def create_preset(
         "description": description,
         "category": category,
         "command_template": command_template,
-        "input_file_patterns": json.dumps(input_patterns),
-        "output_file_patterns": json.dumps(output_patterns),
+        "input_file_patterns": orjson.dumps(input_patterns).decode(),
+        "output_file_patterns": orjson.dumps(output_patterns).decode(),
         "tags": tags_list,
         "tool": tool,
         "is_public": is_public,
     }
     
     try:
-        result = sb.create_preset(preset_data)
+        result = await asyncio.to_thread(sb.create_preset, preset_data)
         return {"status": "ok", "preset": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create preset: {str(e)}")
@@ -826,6 +1075,8 @@ def list_presets(
     user_id: Optional[str] = Query(None),
     limit: int = Query(50, le=100),
     offset: int = Query(0),
+    cursor: Optional[str] = Query(None),
+    sb: SupabaseClient = Depends(get_sb),
     current_user: str = Depends(get_current_user)
 ):
     """
@@ -836,7 +1087,21 @@ def list_presets(
     - tag: Filter by tag
     - search: Search in name and description
     - user_id: Filter by creator (to see your own presets)
+    
+    Pagination: pass the returned next_cursor as `cursor` to get the next
+    page (preferred over `offset`, which is kept for older clients).
     """
+    after_likes = after_id = None
+    if cursor:
+        likes, _, after_id = cursor.partition(":")
+        # Both parts end up in a PostgREST filter expression, so only accept
+        # an integer and a UUID
+        try:
+            after_likes = int(likes)
+            after_id = UUID(after_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
     try:
         presets = sb.list_presets(
             category=category,
@@ -844,9 +1109,15 @@ def list_presets(
             search=search,
             user_id=user_id,
             limit=limit,
-            offset=offset
+            offset=offset,
+            after_likes=after_likes,
+            after_id=after_id
         )
-        return {"status": "ok", "presets": presets, "count": len(presets)}
+        next_cursor = None
+        if len(presets) == limit:
+            last = presets[-1]
+            next_cursor = f"{last['likes_count']}:{last['id']}"
+        return {"status": "ok", "presets": presets, "count": len(presets), "next_cursor": next_cursor}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list presets: {str(e)}")
 
@@ -854,6 +1125,7 @@ def list_presets(
 @app.get("/api/presets/{preset_id}")
 def get_preset(
     preset_id: str,
+    sb: SupabaseClient = Depends(get_sb),
     current_user: str = Depends(get_current_user)
 ):
     """Get detailed information about a specific preset."""
@@ -876,11 +1148,12 @@ def get_preset(
 @app.post("/api/presets/{preset_id}/like")
 async def like_preset(
     preset_id: str,
+    sb: SupabaseClient = Depends(get_sb),
     current_user: str = Depends(get_current_user)
 ):
     """Like/unlike a preset (toggle)."""
     try:
-        result = sb.toggle_preset_like(preset_id, current_user)
+        result = await asyncio.to_thread(sb.toggle_preset_like, preset_id, current_user)
         return {"status": "ok", "liked": result["liked"], "likes_count": result["likes_count"]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to like preset: {str(e)}")
@@ -889,11 +1162,12 @@ async def like_preset(
 @app.delete("/api/presets/{preset_id}")
 async def delete_preset(
     preset_id: str,
+    sb: SupabaseClient = Depends(get_sb),
     current_user: str = Depends(get_current_user)
 ):
     """Delete a preset (only creator can delete)."""
     try:
-        preset = sb.get_preset_by_id(preset_id)
+        preset = await asyncio.to_thread(get_preset_cached, sb, preset_id)
         if not preset:
             raise HTTPException(status_code=404, detail="Preset not found")
         
@@ -901,7 +1175,9 @@ async def delete_preset(
         if preset["user_id"] != current_user:
             raise HTTPException(status_code=403, detail="You can only delete your own presets")
         
-        sb.delete_preset(preset_id)
+        await asyncio.to_thread(sb.delete_preset, preset_id)
+        with _preset_cache_lock:
+            _preset_cache.pop(preset_id, None)
         return {"status": "ok", "message": "Preset deleted successfully"}
     except HTTPException:
         raise
@@ -912,7 +1188,9 @@ async def delete_preset(
 @app.post("/api/presets/{preset_id}/execute")
 async def execute_preset(
     preset_id: str,
+    background_tasks: BackgroundTasks,
     file_mappings: str = Form(...),  # JSON: {"input_file": "actual_filename.jpg"}
+    sb: SupabaseClient = Depends(get_sb),
     current_user: str = Depends(get_current_user)
 ):
     """
@@ -925,18 +1203,18 @@ async def execute_preset(
     """
     try:
         # Get preset
-        preset = sb.get_preset_by_id(preset_id)
+        preset = await asyncio.to_thread(get_preset_cached, sb, preset_id)
         if not preset:
             raise HTTPException(status_code=404, detail="Preset not found")
         
         # Parse file mappings
         try:
-            mappings = json.loads(file_mappings)
-        except json.JSONDecodeError:
+            mappings = orjson.loads(file_mappings)
+        except orjson.JSONDecodeError:
             raise HTTPException(status_code=400, detail="Invalid file_mappings JSON")
         
         # Parse preset patterns
-        output_patterns = json.loads(preset["output_file_patterns"])
+        output_patterns = orjson.loads(preset["output_file_patterns"])
         
         # Render command
         rendered_command, expected_outputs = render_preset_command(
@@ -947,17 +1225,19 @@ async def execute_preset(
         
         # Execute in Docker
         user_dir = user_folder(current_user)
-        new_files = execute_command_in_docker(
+        new_files = await asyncio.to_thread(
+            execute_command_in_docker,
             user_dir, 
             rendered_command, 
             list(mappings.values())
         )
         
         # Register new files
-        new_files_metadata = register_generated_files(user_dir, new_files, current_user)
+        new_files_metadata = await register_generated_files(user_dir, new_files, current_user)
         
-        # Increment usage count
-        sb.increment_preset_usage(preset_id)
+        # Increment usage count after the response is sent (the sync
+        # function runs in the threadpool)
+        background_tasks.add_task(sb.increment_preset_usage, preset_id)
         
         return {
             "status": "ok",
@@ -0,0 +1,35 @@
+"""
+Response models for the most frequently hit endpoints.
+
+Declaring them lets FastAPI validate and serialize the response with
+pydantic-core in one pass instead of walking free-form dicts through
+jsonable_encoder.
+"""
+from pydantic import BaseModel
+from typing import List, Optional
+
+
+class UploadedFile(BaseModel):
+    id: str
+    original_filename: str
+    stored_filename: str
+    content_type: Optional[str] = None
+    path: str
+
+
+class UploadResponse(BaseModel):
+    status: str
+    files: List[UploadedFile]
+    file_count: int
+    message: str
+
+
+class UserFile(BaseModel):
+    filename: str
+    size: int
+    modified: str
+    download_url: str
+
+
+class UserDirectoryListing(BaseModel):
+    files: List[UserFile]
@@ -0,0 +1,112 @@
+"""
+Validation of AI-generated Linux commands before they are executed.
+
+Kept free of app dependencies so it can be imported (and tested) on its own.
+"""
+from functools import lru_cache
+from typing import List
+
+# Commands that do nothing useful (or just print help) without arguments
+_COMMANDS_NEEDING_ARGS = frozenset({
+    'pdftocairo', 'pdftotext', 'pdfimages', 'pdfinfo',
+    'ffmpeg', 'convert', 'mogrify', 'tesseract',
+})
+# pdftocairo needs one of these to know which format to write
+_PDFTOCAIRO_FORMATS = frozenset({'-png', '-jpeg', '-pdf', '-svg', '-tiff', '-ps', '-eps'})
+# Shell loops and control structures aren't validated
+_SHELL_KEYWORDS = frozenset({'for', 'while', 'if'})
+# Error messages for the generic check, formatted once per command
+_MISSING_ARGS_ERRORS = {
+    cmd: f"{cmd} command appears to be missing required arguments"
+    for cmd in _COMMANDS_NEEDING_ARGS
+}
+
+
+def _check_pdftocairo(parts: List[str]) -> str:
+    # Match whole tokens, so a filename like "my-pdf-notes.pdf" isn't
+    # mistaken for the -pdf flag
+    if _PDFTOCAIRO_FORMATS.isdisjoint(parts):
+        return "pdftocairo command missing output format flag (-png, -jpeg, -pdf, etc.)"
+    
+    # Check for input/output files (at least 2 arguments after flags); only
+    # the count matters, so stop as soon as there are two
+    non_flag_args = 0
+    for p in parts[1:]:
+        if p[:1] != '-':
+            non_flag_args += 1
+            if non_flag_args == 2:
+                break
+    if non_flag_args < 2:
+        return "pdftocairo command missing input PDF and/or output file arguments"
+    return ""
+
+
+def _check_ffmpeg(parts: List[str]) -> str:
+    # A token check, so "video-interview.mp4" doesn't count as the -i flag
+    if '-i' not in parts:
+        return "ffmpeg command missing -i input file flag"
+    return ""
+
+
+def _check_min_args(parts: List[str]) -> str:
+    # Generic check for minimum number of arguments (mogrify can work with
+    # wildcards, so this is all it gets too)
+    if len(parts) < 2:
+        return _MISSING_ARGS_ERRORS[parts[0]]
+    return ""
+
+
+# Base command -> check returning an error message ("" if fine); one dict
+# lookup per command instead of an if/elif chain
+_ARG_CHECKS = {cmd: _check_min_args for cmd in _COMMANDS_NEEDING_ARGS}
+_ARG_CHECKS.update(pdftocairo=_check_pdftocairo, ffmpeg=_check_ffmpeg)
+
+
+# Pure function of the string; cached replies and presets repeat commands
+@lru_cache(maxsize=1024)
+def validate_command(command: str) -> tuple[bool, str]:
+    """
+    Validate that a command has proper arguments and is not just showing help.
+    Handles chained commands with && operators.
+    
+    Args:
+        command: The Linux command to validate (may contain && for chaining)
+        
+    Returns:
+        Tuple of (is_valid, error_message)
+    """
+    # Check if command is empty (or only whitespace). The splitting below
+    # ignores surrounding whitespace, so the command itself is never stripped
+    if not command or command.isspace():
+        return False, "Command is empty"
+    
+    # Split by && to handle chained commands, then validate each command in
+    # the chain. split() with no separator already drops the surrounding
+    # whitespace, so no strip() copies are needed
+    has_parts = False
+    for cmd_part in command.split('&&'):
+        # Split off just the base command; the arguments are only tokenized
+        # for commands that have a check
+        head = cmd_part.split(None, 1)
+        if not head:
+            continue
+        has_parts = True
+        
+        base_cmd = head[0]
+        
+        # Skip validation for shell loops and control structures
+        if base_cmd in _SHELL_KEYWORDS:
+            continue  # Complex shell constructs are allowed
+        
+        # Check if this command requires arguments
+        check = _ARG_CHECKS.get(base_cmd)
+        if check is not None:
+            parts = cmd_part.split() if len(head) > 1 else head
+            error = check(parts)
+            if error:
+                return False, error
+    
+    if not has_parts:
+        return False, "Command has no parts"
+    
+    return True, ""
@@ -0,0 +1,34 @@
+-- Migration: Toggle a preset like atomically in one RPC
+-- Run this in your Supabase SQL Editor
+
+-- Replaces the check / insert-or-delete / counter-update sequence done from
+-- the backend. Everything runs in one transaction and the preset row is
+-- locked, so concurrent toggles can no longer double count.
+CREATE OR REPLACE FUNCTION toggle_preset_like(p_preset_id uuid, p_user_id text)
+RETURNS TABLE (liked boolean, likes_count integer)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    new_count integer;
+BEGIN
+    PERFORM 1 FROM presets WHERE id = p_preset_id FOR UPDATE;
+
+    DELETE FROM preset_likes WHERE preset_id = p_preset_id AND user_id = p_user_id;
+    IF FOUND THEN
+        UPDATE presets SET likes_count = GREATEST(likes_count - 1, 0)
+        WHERE id = p_preset_id
+        RETURNING likes_count INTO new_count;
+        liked := false;
+    ELSE
+        INSERT INTO preset_likes (preset_id, user_id) VALUES (p_preset_id, p_user_id);
+        UPDATE presets SET likes_count = likes_count + 1
+        WHERE id = p_preset_id
+        RETURNING likes_count INTO new_count;
+        liked := true;
+    END IF;
+
+    likes_count := new_count;
+    RETURN NEXT;
+END;
+$$;
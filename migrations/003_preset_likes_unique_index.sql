@@ -0,0 +1,12 @@
+-- Migration: One like per user per preset, backed by a composite unique index
+-- Run this in your Supabase SQL Editor
+
+-- Remove duplicate likes left by the old non-atomic toggle, keeping one row each
+DELETE FROM preset_likes a
+USING preset_likes b
+WHERE a.preset_id = b.preset_id
+  AND a.user_id = b.user_id
+  AND a.ctid > b.ctid;
+
+-- Lets has_user_liked_preset / toggle_preset_like look a like up with an index-only scan
+CREATE UNIQUE INDEX IF NOT EXISTS idx_preset_likes_preset_user ON preset_likes(preset_id, user_id);
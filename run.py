@@ -2,10 +2,19 @@
 Startup script for the FastAPI application
 
 Run this to start the server with AI agent integration.
+
+    python run.py          # single worker
+    python run.py --dev    # single worker with auto-reload
 """
+import argparse
+import sys
 import uvicorn
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start refile-backend")
+    parser.add_argument("--dev", action="store_true", help="single worker with auto-reload")
+    args = parser.parse_args()
+    
     print("Starting refile-backend with AI integration...")
     print("AI agent ready for media processing commands")
     print("\nPress CTRL+C to stop the server\n")
@@ -14,6 +23,13 @@ if __name__ == "__main__":
         "app.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        reload=args.dev,
+        # One process: conversation history, the response cache, the per-user
+        # worker containers and the preset/prompt caches all live in memory,
+        # so a follow-up landing on another worker would lose its context
+        workers=1,
+        # uvloop/httptools ship with uvicorn[standard]; uvloop has no Windows build
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
         log_level="info"
     )
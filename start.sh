@@ -36,7 +36,7 @@ echo ""
 echo "📋 Next steps:"
 echo "   1. Run the database schema in Supabase (see schema.sql)"
 echo "   2. Start the server:"
-echo "      uvicorn app.main:app --reload --host 0.0.0.0 --port 8000"
+echo "      uvicorn app.main:app --reload --host 0.0.0.0 --port 8000 --loop uvloop --http httptools"
 echo ""
 echo "   3. Test the API (see API_EXAMPLES.md)"
 echo ""
@@ -3,6 +3,7 @@ Test script for the AI agent integration
 
 This script tests the MediaProcessingAgent without running the full FastAPI app.
 """
+import asyncio
 import sys
 import os
 
@@ -11,15 +12,15 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from app.ai_agent import MediaProcessingAgent
 
-def test_agent():
-    """Test the AI agent with a simple request."""
+async def run_agent_requests():
+    """Run a request and a follow-up through the AI agent."""
     print("Initializing AI agent...")
     agent = MediaProcessingAgent()
     
     print("\nTest 1: Extract audio from video")
     print("-" * 50)
     
-    response = agent.process_request(
+    response = await agent.process_request(
         user_prompt="Extract audio from the video as MP3",
         uploaded_files=["wedding_video.mp4"],
         user_id="test_user_1",
@@ -40,7 +41,7 @@ def test_agent():
     print("-" * 50)
     
     # Use the previous response for context
-    response2 = agent.process_request(
+    response2 = await agent.process_request(
         user_prompt="Can you convert that audio to WAV format?",
         uploaded_files=["wedding_video.mp4"],
         user_id="test_user_1",
@@ -55,6 +56,12 @@ def test_agent():
         print(f"Description: {resp2.description}")
     else:
         print(f"Response: {response2}")
+    
+    await agent.aclose()
+
+def test_agent():
+    """Test the AI agent with a simple request (sync, so pytest can collect it)."""
+    asyncio.run(run_agent_requests())
 
 if __name__ == "__main__":
     try:
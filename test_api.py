@@ -3,19 +3,22 @@ Test client for the FastAPI application
 
 This script tests the /api/upload endpoint with AI integration.
 """
-import requests
-import json
+import httpx
+import orjson
 import io
 
 # Configuration
 BASE_URL = "http://localhost:8000"
 USER_ID = "test_user_123"
 
+# One keep-alive client for the whole run, so requests reuse the connection
+client = httpx.Client(base_url=BASE_URL, timeout=60)
+
 def test_health():
     """Test the health endpoint."""
     print("Testing health endpoint...")
-    response = requests.get(f"{BASE_URL}/api/health")
-    print(f"✅ Health check: {response.json()}\n")
+    response = client.get("/api/health")
+    print(f"✅ Health check: {orjson.loads(response.content)}\n")
 
 def test_upload_with_ai():
     """Test file upload with AI processing."""
@@ -38,15 +41,15 @@ def test_upload_with_ai():
     
     # Send request
     try:
-        response = requests.post(
-            f"{BASE_URL}/api/upload",
+        response = client.post(
+            "/api/upload",
             files=files,
             data=data,
             headers=headers
         )
         
         if response.status_code == 200:
-            result = response.json()
+            result = orjson.loads(response.content)
             print("✅ Upload successful!")
             print(f"\nFile info:")
             print(f"  - Original filename: {result['file']['original_filename']}")
@@ -82,10 +85,10 @@ def test_followup(previous_result):
     
     data = {
         'prompt': 'Convert that audio to WAV format',
-        'uploaded_files': json.dumps(["wedding_video.mp4"]),
+        'uploaded_files': orjson.dumps(["wedding_video.mp4"]).decode(),
         'previous_command': ai_resp['linux_command'],
-        'previous_input_files': json.dumps(ai_resp['input_files']),
-        'previous_output_files': json.dumps(ai_resp['output_files']),
+        'previous_input_files': orjson.dumps(ai_resp['input_files']).decode(),
+        'previous_output_files': orjson.dumps(ai_resp['output_files']).decode(),
         'previous_description': ai_resp['description']
     }
     headers = {
@@ -93,14 +96,14 @@ def test_followup(previous_result):
     }
     
     try:
-        response = requests.post(
-            f"{BASE_URL}/api/process",
+        response = client.post(
+            "/api/process",
             data=data,
             headers=headers
         )
         
         if response.status_code == 200:
-            result = response.json()
+            result = orjson.loads(response.content)
             print("✅ Follow-up successful!")
             
             print(f"\n🤖 AI Response:")
@@ -131,6 +134,8 @@ if __name__ == "__main__":
     # Test follow-up
     test_followup(result)
     
+    client.close()
+    
     print("\n" + "="*60)
     print("✅ All tests completed!")
     print("="*60)
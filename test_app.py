@@ -38,7 +38,7 @@ async def process_only(
         agent = get_agent()
         
         # Process with AI
-        result = agent.process_request(
+        result = await agent.process_request(
             user_prompt=prompt,
             uploaded_files=filenames,
             user_id="test_user",  # Dummy user for testing